@@ -0,0 +1,207 @@
+"""Асинхронные версии читающих эндпоинтов для запуска через ASGI.
+
+В Django 3.2 нет асинхронного ORM, поэтому каждый запрос к базе
+выполняется в пуле потоков через sync_to_async, а независимые запросы
+одного HTTP-запроса (теги, ингредиенты, избранное, корзина, подписки)
+отправляются одновременно через asyncio.gather.
+"""
+import asyncio
+from functools import wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import (
+    Count, Prefetch, prefetch_related_objects)
+from django.http import Http404, JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+
+from cookbook.models import (
+    Cart, Favourite, Follow, Ingredient, Recipe, RecipeIngredient, Tag)
+from cookbook.versions import get_version
+from . import recipe_cache
+from .authentication import CachedTokenAuthentication
+from .filters import RecipeFilter
+from .paginations import CustomPagination
+from .replicas import cache_timeout
+from .serializers import (
+    FollowSerializer, IngredientSerializer, ReadRecipeSerializer,
+    TagSerializer)
+
+
+def run(func, *args):
+    """Выполняет func в отдельном потоке со своим соединением с базой."""
+    @wraps(func)
+    def in_thread():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(in_thread, thread_sensitive=False)()
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return JsonResponse(
+        data, status=status, safe=False,
+        json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view):
+    """Оборачивает запрос в DRF Request и переводит ошибки в ответы."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response(
+                {'detail': 'Метод не разрешён.'},
+                status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        request = Request(
+            request, authenticators=[CachedTokenAuthentication()])
+        try:
+            await run(lambda: request.user)
+            return await view(request, *args, **kwargs)
+        except exceptions.APIException as error:
+            return json_response(
+                {'detail': str(error.detail)}, status=error.status_code)
+        except Http404:
+            return json_response(
+                {'detail': 'Страница не найдена.'},
+                status=status.HTTP_404_NOT_FOUND)
+    return wrapper
+
+
+def id_set(queryset, field):
+    return set(queryset.values_list(field, flat=True))
+
+
+async def attach_related(request, recipes):
+    """Загружает связанные данные и признаки пользователя одновременно."""
+    user = request.user
+    recipe_ids = [recipe.id for recipe in recipes]
+    author_ids = {recipe.author_id for recipe in recipes}
+    for recipe in recipes:
+        # Оба prefetch пишут в этот словарь из разных потоков.
+        recipe._prefetched_objects_cache = {}
+    lookups = [
+        run(prefetch_related_objects, recipes, 'tags'),
+        run(prefetch_related_objects, recipes, Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related('ingredient'))),
+    ]
+    if user.is_authenticated:
+        lookups += [
+            run(id_set, Favourite.objects.filter(
+                user=user, recipe_id__in=recipe_ids), 'recipe_id'),
+            run(id_set, Cart.objects.filter(
+                user=user, recipe_id__in=recipe_ids), 'recipe_id'),
+            run(id_set, Follow.objects.filter(
+                user=user, following_id__in=author_ids), 'following_id'),
+        ]
+    results = await asyncio.gather(*lookups)
+    favorites, carts, follows = (
+        results[2:] if user.is_authenticated else (set(), set(), set()))
+    for recipe in recipes:
+        recipe.is_favorited = recipe.id in favorites
+        recipe.is_in_shopping_cart = recipe.id in carts
+        recipe.is_author_subscribed = recipe.author_id in follows
+
+
+@api_view
+async def recipe_list(request):
+    queryset = Recipe.objects.select_related('author')
+    ordering = ('-pub_date', '-id')
+    if request.query_params.get('ordering') == 'popular':
+        ordering = None
+        queryset = queryset.order_by('-favorites_count', '-id')
+    queryset = await run(lambda: RecipeFilter(
+        request.query_params, queryset=queryset, request=request).qs)
+    paginator = CustomPagination()
+    view = SimpleNamespace(cursor_ordering=ordering)
+    page = await run(lambda: list(paginator.paginate_queryset(
+        queryset, request, view)))
+    await attach_related(request, page)
+    data = await run(lambda: ReadRecipeSerializer(
+        page, many=True, context={'request': request}).data)
+    return json_response(paginator.get_paginated_response(data).data)
+
+
+@api_view
+async def recipe_detail(request, pk):
+    key = await run(recipe_cache.get_key, pk, request)
+    data = await run(recipe_cache.get, key)
+    if data is None:
+        recipe = await run(lambda: Recipe.objects.select_related(
+            'author').filter(pk=pk).first())
+        if recipe is None:
+            raise Http404
+        await attach_related(request, [recipe])
+        data = await run(lambda: ReadRecipeSerializer(
+            recipe, context={'request': request}).data)
+        await run(recipe_cache.save, key, data)
+        return json_response(data)
+    user = request.user
+    flags = dict.fromkeys(
+        ('is_favorited', 'is_in_shopping_cart', 'is_author_subscribed'),
+        False)
+    if user.is_authenticated:
+        flags.update(zip(flags, await asyncio.gather(
+            run(Favourite.objects.filter(user=user, recipe_id=pk).exists),
+            run(Cart.objects.filter(user=user, recipe_id=pk).exists),
+            run(Follow.objects.filter(
+                user=user, following_id=data['author']['id']).exists),
+        )))
+    return json_response(recipe_cache.overlay(data, flags))
+
+
+@api_view
+async def tag_list(request):
+    data = await run(lambda: cache.get_or_set(
+        'tags:{0}'.format(get_version(Tag)),
+        lambda: TagSerializer(Tag.objects.all(), many=True).data,
+        cache_timeout()))
+    return json_response(data)
+
+
+@api_view
+async def ingredient_list(request):
+    queryset = Ingredient.objects.all()
+    name = request.query_params.get('name')
+    if name:
+        queryset = queryset.filter(name__istartswith=name)
+    data = await run(
+        lambda: IngredientSerializer(queryset, many=True).data)
+    return json_response(data)
+
+
+@api_view
+async def subscriptions(request):
+    user = request.user
+    if not user.is_authenticated:
+        raise exceptions.NotAuthenticated
+    paginator = CustomPagination()
+    view = SimpleNamespace(cursor_ordering=('-id',))
+    page = await run(lambda: list(paginator.paginate_queryset(
+        user.follower.select_related('following').order_by('-id'),
+        request, view)))
+    authors = {follow.following_id: follow.following for follow in page}
+    recipes = Recipe.objects.filter(author_id__in=list(authors))
+    limit = request.query_params.get('recipes_limit')
+    if limit and limit.isdigit():
+        recipes = recipes.newest_per_author(int(limit))
+    counts, recipes = await asyncio.gather(
+        run(lambda: dict(Recipe.objects.filter(
+            author_id__in=list(authors)
+        ).order_by().values('author_id').annotate(
+            total=Count('id')).values_list('author_id', 'total'))),
+        run(list, recipes),
+    )
+    for author in authors.values():
+        author.limited_recipes = []
+    for recipe in recipes:
+        authors[recipe.author_id].limited_recipes.append(recipe)
+    for follow in page:
+        follow.recipes_count = counts.get(follow.following_id, 0)
+    data = await run(lambda: FollowSerializer(
+        page, many=True, context={'request': request}).data)
+    return json_response(paginator.get_paginated_response(data).data)
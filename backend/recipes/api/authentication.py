@@ -0,0 +1,76 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .replicas import use_primary_if_pinned
+
+
+class TokenCache:
+    """LRU-кэш токенов с ограниченным временем жизни записи.
+
+    Хранится в памяти процесса: токен, отозванный в другом процессе,
+    перестаёт действовать здесь не позже чем через ttl секунд.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._tokens = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._tokens.get(key)
+            if item is None:
+                return None
+            token, expires = item
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._tokens.move_to_end(key)
+        return copy.deepcopy(token)
+
+    def set(self, token):
+        with self._lock:
+            self._remove(token.key)
+            self._tokens[token.key] = (
+                copy.deepcopy(token), time.monotonic() + self.ttl)
+            self._keys_by_user[token.user_id] = token.key
+            while len(self._tokens) > self.size:
+                self._remove(next(iter(self._tokens)))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            key = self._keys_by_user.get(user_id)
+            if key is not None:
+                self._remove(key)
+
+    def _remove(self, key):
+        item = self._tokens.pop(key, None)
+        if item is not None:
+            self._keys_by_user.pop(item[0].user_id, None)
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которая не обращается к базе для токенов,
+    уже проверенных в этом процессе."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(token)
+        use_primary_if_pinned(token.user_id)
+        return token.user, token
@@ -0,0 +1,44 @@
+import hashlib
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from cookbook.versions import get_version
+from .replicas import cache_timeout
+
+
+class CachedReadMixin:
+    """Кэширует ответы list и retrieve и отвечает 304 на If-None-Match.
+
+    ETag зависит от версии модели, которую повышают сигналы при любом
+    изменении. Устаревший ответ исключён, только если версии хранятся
+    в общем для процессов кэше (см. cookbook.versions).
+    """
+
+    def get_etag(self, request):
+        model = self.queryset.model
+        value = '{0}:{1}:{2}'.format(
+            model._meta.label_lower, get_version(model),
+            request.get_full_path())
+        return '"{0}"'.format(hashlib.md5(value.encode()).hexdigest())
+
+    def cached_response(self, request, build):
+        etag = self.get_etag(request)
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        key = 'response:' + etag
+        data = cache.get(key)
+        if data is None:
+            data = build().data
+            cache.set(key, data, cache_timeout())
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(
+            CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(
+            CachedReadMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,68 @@
+"""Проверка постоянных соединений с базой и отчёт о настройках пула."""
+import time
+
+from django.conf import settings
+from django.core import checks
+
+POOL_ENGINE = 'recipes.postgresql_pool'
+
+
+def mark_used(connection):
+    connection.last_used = time.monotonic()
+
+
+def health_check(connection):
+    """Закрывает переиспользуемое соединение, если база его оборвала.
+
+    В Django 3.2 нет CONN_HEALTH_CHECKS: без проверки первый запрос после
+    перезапуска базы или балансировщика завершился бы ошибкой. Запросом
+    к базе проверяются только соединения, простаивавшие дольше
+    DB_HEALTH_CHECK_IDLE секунд после прошлого запроса.
+    """
+    idle = time.monotonic() - getattr(connection, 'last_used', 0)
+    if (connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and connection.connection is not None
+            and not connection.in_atomic_block
+            and idle > settings.DB_HEALTH_CHECK_IDLE
+            and not connection.is_usable()):
+        connection.close()
+
+
+def describe(alias, settings_dict):
+    pool = settings_dict.get('OPTIONS', {}).get('pool')
+    if settings_dict['ENGINE'] == POOL_ENGINE and pool:
+        mode = ('пул psycopg2 {0}-{1} соединений на процесс, ожидание '
+                'свободного до {2} с').format(
+            pool.get('min_size', pool.get('max_size')), pool.get('max_size'),
+            pool.get('timeout', 30))
+    elif settings_dict.get('CONN_MAX_AGE'):
+        mode = 'постоянные соединения, CONN_MAX_AGE={0}'.format(
+            settings_dict['CONN_MAX_AGE'])
+    else:
+        mode = 'новое соединение на каждый запрос'
+    return '{0}: {1}, проверка соединений {2}'.format(
+        alias, mode,
+        'включена' if settings_dict.get('CONN_HEALTH_CHECKS')
+        else 'выключена')
+
+
+@checks.register()
+def check_connection_pooling(app_configs, **kwargs):
+    messages = [
+        checks.Info(describe(alias, settings_dict), id='api.I001')
+        for alias, settings_dict in settings.DATABASES.items()
+    ]
+    if settings.DB_POOL_SIZE:
+        for alias, settings_dict in settings.DATABASES.items():
+            if settings_dict['ENGINE'] != POOL_ENGINE:
+                messages.append(checks.Warning(
+                    '{0}: DB_POOL_SIZE задан, но пул поддерживается '
+                    'только для PostgreSQL.'.format(alias),
+                    id='api.W001'))
+            elif settings_dict.get('CONN_MAX_AGE'):
+                messages.append(checks.Warning(
+                    '{0}: при пуле соединений CONN_MAX_AGE должен быть 0, '
+                    'иначе соединение не возвращается в пул после '
+                    'запроса.'.format(alias),
+                    hint='Уберите DB_CONN_MAX_AGE.', id='api.W002'))
+    return messages
@@ -0,0 +1,125 @@
+"""Фоновая выгрузка списка покупок в PDF и CSV.
+
+Запрос ставит задачу в пул потоков процесса, задача сохраняет файл
+в хранилище под хэшем содержимого списка. Пока корзина не меняется,
+повторные загрузки отдают готовый файл без построения.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table
+
+from cookbook.models import ShoppingListExport
+from .shopping_list import render_csv
+
+logger = logging.getLogger(__name__)
+
+FONT = 'ExportFont'
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.EXPORT_WORKERS, thread_name_prefix='export')
+
+
+def cart_hash(items):
+    """Хэш содержимого списка покупок."""
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update('{0}\0{1}\0{2}\n'.format(
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total']).encode())
+    return digest.hexdigest()
+
+
+def render_pdf(items):
+    if FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT, settings.EXPORT_PDF_FONT))
+    styles = getSampleStyleSheet()
+    styles['Title'].fontName = FONT
+    rows = [['Ингредиент', 'Единица', 'Количество']] + [
+        [item['ingredient__name'], item['ingredient__measurement_unit'],
+         item['total']]
+        for item in items
+    ]
+    table = Table(rows, colWidths=(280, 100, 90), repeatRows=1)
+    table.setStyle([
+        ('FONTNAME', (0, 0), (-1, -1), FONT),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1),
+         (colors.white, colors.whitesmoke)),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+    ])
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4, title='Список покупок').build(
+        [Paragraph('Список покупок', styles['Title']), table])
+    return buffer.getvalue()
+
+
+def render_csv_file(items):
+    return ''.join(render_csv(items)).encode()
+
+
+RENDERERS = {
+    'pdf': render_pdf,
+    'csv': render_csv_file,
+}
+
+
+def build(export_id, items):
+    try:
+        export = ShoppingListExport.objects.get(pk=export_id)
+        name = 'exports/{0}.{1}'.format(
+            export.cart_hash, export.file_format)
+        if not default_storage.exists(name):
+            content = RENDERERS[export.file_format](items)
+            name = default_storage.save(name, ContentFile(content))
+        ShoppingListExport.objects.filter(pk=export_id).update(
+            status=ShoppingListExport.DONE, file=name,
+            updated=timezone.now())
+    except Exception:
+        logger.exception('Не удалось построить выгрузку %s', export_id)
+        ShoppingListExport.objects.filter(pk=export_id).update(
+            status=ShoppingListExport.FAILED, updated=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def request_export(items, file_format):
+    """Готовая выгрузка или выгрузка, поставленная в очередь.
+
+    Задачу ставит только запрос, который перевёл запись в очередь:
+    новую, завершившуюся ошибкой или зависшую дольше EXPORT_TIMEOUT
+    (например, если процесс с задачей был перезапущен).
+    """
+    items = list(items)
+    export, created = ShoppingListExport.objects.get_or_create(
+        cart_hash=cart_hash(items), file_format=file_format)
+    if export.status == ShoppingListExport.DONE and (
+            default_storage.exists(export.file.name)):
+        return export
+    stale = timezone.now() - timedelta(seconds=settings.EXPORT_TIMEOUT)
+    claimed = created or ShoppingListExport.objects.filter(
+        Q(status=ShoppingListExport.PENDING, updated__lt=stale)
+        | ~Q(status=ShoppingListExport.PENDING),
+        pk=export.pk, updated=export.updated,
+    ).update(status=ShoppingListExport.PENDING, updated=timezone.now())
+    if claimed:
+        export.status = ShoppingListExport.PENDING
+        transaction.on_commit(
+            lambda: executor.submit(build, export.pk, items))
+    return export
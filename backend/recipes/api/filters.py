@@ -1,19 +1,35 @@
-from django_filters import (FilterSet, NumberFilter,
-                            ModelMultipleChoiceFilter)
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef
+from django_filters import (FilterSet, NumberFilter, CharFilter,
+                            ChoiceFilter)
 
-from cookbook.models import Recipe, Tag
+from cookbook.models import Recipe, RecipeTag, Tag
+from cookbook.search import search as search_recipes
+from cookbook.versions import get_version
+from .replicas import cache_timeout
+
+
+def get_tag_ids(slugs):
+    """Идентификаторы тегов по slug из кэша, обновляемого вместе
+    с версией модели Tag. Неизвестные slug пропускаются."""
+    key = 'tag_slugs:{0}'.format(get_version(Tag))
+    slug_map = cache.get(key)
+    if slug_map is None:
+        slug_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, slug_map, cache_timeout())
+    return {slug_map[slug] for slug in slugs if slug in slug_map}
 
 
 class RecipeFilter(FilterSet):
     is_favorited = NumberFilter(method='filter_favorited')
     is_in_shopping_cart = NumberFilter(method='filter_cart')
     author = NumberFilter(field_name='author__id')
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        # lookup_expr='in',
-        queryset=Tag.objects.all()
+    tags_mode = ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')),
+        method='filter_tags_mode'
     )
+    tags = CharFilter(method='filter_tags')
+    search = CharFilter(method='filter_search')
 
     def filter_favorited(self, queryset, name, value):
         if value == 1:
@@ -23,9 +39,27 @@ class RecipeFilter(FilterSet):
         if value == 1:
             return queryset.filter(in_cart_of=self.request.user)
 
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def filter_tags(self, queryset, name, value):
+        slugs = set(self.request.query_params.getlist(name))
+        tag_ids = get_tag_ids(slugs)
+        links = RecipeTag.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            if len(tag_ids) < len(slugs):
+                return queryset.none()
+            return queryset.filter(pk__in=links.values('recipe_id').annotate(
+                matched=Count('tag_id')
+            ).filter(matched=len(tag_ids)).values('recipe_id'))
+        return queryset.filter(Exists(links.filter(recipe=OuterRef('pk'))))
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
         fields = [
             'is_favorited', 'is_in_shopping_cart',
-            'author', 'tags'
+            'author', 'tags', 'tags_mode', 'search'
             ]
@@ -0,0 +1,55 @@
+from bisect import bisect_left
+
+from cookbook.models import Ingredient
+from cookbook.versions import get_version
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Строится из таблицы Ingredient при первом обращении и заново, когда
+    меняется версия Ingredient: её повышают сигналы моделей и
+    load_ingredients, поэтому индекс видит и изменения из других
+    процессов, если кэш общий.
+    """
+
+    def __init__(self):
+        self._data = None
+
+    def build(self):
+        version = get_version(Ingredient)
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].lower(), row['id'])
+        )
+        keys = [row['name'].lower() for row in rows]
+        self._data = (version, keys, rows)
+        return self._data
+
+    def refresh(self):
+        data = self._data
+        if data is None or data[0] != get_version(Ingredient):
+            data = self.build()
+        return data
+
+    def search(self, query, limit):
+        """Ингредиенты, чьё название начинается с query, затем те,
+        в названии которых query встречается в другом месте."""
+        _, keys, rows = self.refresh()
+        query = query.lower()
+        result = []
+        position = bisect_left(keys, query)
+        while (len(result) < limit and position < len(keys)
+               and keys[position].startswith(query)):
+            result.append(rows[position])
+            position += 1
+        if len(result) < limit:
+            for key, row in zip(keys, rows):
+                if query in key and not key.startswith(query):
+                    result.append(row)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,115 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from cookbook.models import Ingredient, Recipe, Tag, User
+
+# Наибольшее допустимое число SQL-запросов на один вызов эндпоинта.
+QUERY_BUDGETS = {
+    'recipes': 6,
+    'recipes_cursor': 5,
+    'recipes_author': 6,
+    'recipes_tags': 6,
+    'recipes_favorited': 6,
+    'recipes_in_cart': 6,
+    'recipe_detail': 5,
+    'similar_recipes': 1,
+    'pantry': 4,
+    'subscriptions': 5,
+    'subscriptions_recipes_limit': 5,
+    'feed': 8,
+    'download_shopping_cart': 2,
+    'ingredients_search': 2,
+    'ingredients_autocomplete': 2,
+    'tags': 2,
+}
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет эндпоинты API через тестовый клиент, выводит '
+            'перцентили задержки и число запросов к базе и завершается '
+            'ошибкой при превышении бюджета запросов. '
+            'Данные готовит команда generate_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=6)
+
+    def handle(self, *args, **options):
+        user = User.objects.annotate(
+            carts=Count('cart')).order_by('-carts').first()
+        recipe = Recipe.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if None in (user, recipe, ingredient) or not tags:
+            raise CommandError('Нет данных: выполните generate_data.')
+        token, created = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        limit = options['limit']
+        prefix = ingredient.name[:2]
+        pantry = '&'.join(
+            f'ingredients={pk}'
+            for pk in recipe.ingredients.values_list('id', flat=True)[:5])
+        endpoints = {
+            'recipes': f'/api/recipes/?page=2&limit={limit}',
+            'recipes_cursor': f'/api/recipes/?paginate=cursor&limit={limit}',
+            'recipes_author':
+                f'/api/recipes/?author={recipe.author_id}&limit={limit}',
+            'recipes_tags': '/api/recipes/?{0}&limit={1}'.format(
+                '&'.join(f'tags={slug}' for slug in tags), limit),
+            'recipes_favorited': f'/api/recipes/?is_favorited=1&limit={limit}',
+            'recipes_in_cart':
+                f'/api/recipes/?is_in_shopping_cart=1&limit={limit}',
+            'recipe_detail': f'/api/recipes/{recipe.id}/',
+            'similar_recipes': f'/api/recipes/{recipe.id}/similar/',
+            'pantry': f'/api/recipes/pantry/?{pantry}&limit={limit}',
+            'subscriptions': f'/api/users/subscriptions/?limit={limit}',
+            'subscriptions_recipes_limit':
+                f'/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+            'feed': f'/api/recipes/feed/?limit={limit}',
+            'download_shopping_cart': '/api/recipes/download_shopping_cart/',
+            'ingredients_search': f'/api/ingredients/?name={prefix}',
+            'ingredients_autocomplete':
+                f'/api/ingredients/autocomplete/?name={prefix}',
+            'tags': '/api/tags/',
+        }
+        self.stdout.write(
+            f'{"endpoint":<26}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+            f'{"queries":>9}{"budget":>8}')
+        failed = []
+        for name, url in endpoints.items():
+            timings, queries = self.measure(client, url, options['repeat'])
+            budget = QUERY_BUDGETS[name]
+            quantiles = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f'{name:<26}{quantiles[49] * 1e3:>9.2f}'
+                f'{quantiles[94] * 1e3:>9.2f}{quantiles[98] * 1e3:>9.2f}'
+                f'{queries:>9}{budget:>8}')
+            if queries > budget:
+                failed.append(name)
+        if failed:
+            raise CommandError(
+                'Превышен бюджет запросов: {0}'.format(', '.join(failed)))
+
+    def measure(self, client, url, repeat):
+        """Время каждого вызова и наибольшее число запросов за вызов."""
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url}: код ответа {response.status_code}')
+            queries = max(queries, len(context))
+        return timings, queries
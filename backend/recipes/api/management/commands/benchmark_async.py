@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+
+from cookbook.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность синхронных эндпоинтов '
+            '(один WSGI-воркер, запросы по очереди) и асинхронных '
+            '/api/async/ при одновременных запросах. Задержка сети до '
+            'базы имитируется параметром --db-latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--db-latency', type=float, default=5.0,
+            help='Задержка каждого SQL-запроса, мс.')
+
+    def handle(self, *args, **options):
+        user = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows').first()
+        recipe = Recipe.objects.order_by('id').first()
+        if user is None or recipe is None:
+            raise CommandError('Нет данных: выполните generate_data.')
+        token, created = Token.objects.get_or_create(user=user)
+        self.authorization = f'Token {token.key}'
+        endpoints = {
+            'recipes': 'recipes/?limit=6',
+            'recipe_detail': f'recipes/{recipe.id}/',
+            'subscriptions': 'users/subscriptions/?limit=6&recipes_limit=3',
+            'tags': 'tags/',
+        }
+        latency = options['db_latency'] / 1e3
+
+        def sleep(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def install(connection, **kwargs):
+            if sleep not in connection.execute_wrappers:
+                connection.execute_wrappers.append(sleep)
+
+        connection_created.connect(install)
+        install(connection)
+        try:
+            self.stdout.write(
+                f'{"endpoint":<16}{"sync req/s":>12}{"async req/s":>13}')
+            for name, url in endpoints.items():
+                sync_rate = self.run_sync(url, options['requests'])
+                async_rate = asyncio.run(self.run_async(
+                    url, options['requests'], options['concurrency']))
+                self.stdout.write(
+                    f'{name:<16}{sync_rate:>12.1f}{async_rate:>13.1f}')
+        finally:
+            connection_created.disconnect(install)
+            connection.execute_wrappers.remove(sleep)
+
+    def check_response(self, url, response):
+        if response.status_code != 200:
+            raise CommandError(f'{url}: код ответа {response.status_code}')
+
+    def run_sync(self, url, total):
+        client = Client(HTTP_AUTHORIZATION=self.authorization)
+        started = time.perf_counter()
+        for _ in range(total):
+            self.check_response(url, client.get('/api/' + url))
+        return total / (time.perf_counter() - started)
+
+    async def run_async(self, url, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with semaphore:
+                response = await client.get(
+                    '/api/async/' + url, authorization=self.authorization)
+            self.check_response(url, response)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(total)))
+        return total / (time.perf_counter() - started)
@@ -0,0 +1,72 @@
+import copy
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.utils import load_backend
+
+from api.connections import POOL_ENGINE, health_check, mark_used
+
+POSTGRESQL_ENGINE = 'django.db.backends.postgresql'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает затраты на соединение с базой за запрос: новое '
+            'соединение на каждый запрос, постоянные соединения с '
+            'проверкой и без неё и пул соединений (только PostgreSQL).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        base = copy.deepcopy(connection.settings_dict)
+        base['OPTIONS'].pop('pool', None)
+        postgresql = connection.vendor == 'postgresql'
+        if postgresql:
+            base['ENGINE'] = POSTGRESQL_ENGINE
+        modes = {
+            'per request': {'CONN_MAX_AGE': 0},
+            'persistent': {'CONN_MAX_AGE': 600},
+            'persistent + checks': {
+                'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+        }
+        if postgresql:
+            modes['pool'] = {
+                'ENGINE': POOL_ENGINE, 'CONN_MAX_AGE': 0,
+                'OPTIONS': {**base['OPTIONS'], 'pool': {'max_size': 1}}}
+        self.stdout.write(
+            f'{"mode":<22}{"connect ms":>12}{"request ms":>12}')
+        for name, overrides in modes.items():
+            settings_dict = {
+                **base, 'CONN_HEALTH_CHECKS': False, **overrides}
+            connect, total = self.measure(settings_dict, options['requests'])
+            self.stdout.write(f'{name:<22}{connect:>12.3f}{total:>12.3f}')
+
+    def measure(self, settings_dict, requests):
+        """Среднее время открытия соединения и всего запроса, мс.
+
+        Запрос повторяет жизненный цикл Django: проверки из обработчиков
+        request_started, один SQL-запрос, закрытие и отметка о последнем
+        использовании по request_finished.
+        """
+        backend = load_backend(settings_dict['ENGINE'])
+        wrapper = backend.DatabaseWrapper(settings_dict, 'benchmark')
+        connect = total = 0.0
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                wrapper.close_if_unusable_or_obsolete()
+                health_check(wrapper)
+                wrapper.ensure_connection()
+                connect += time.perf_counter() - started
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                wrapper.close_if_unusable_or_obsolete()
+                if wrapper.connection is not None:
+                    mark_used(wrapper)
+                total += time.perf_counter() - started
+        finally:
+            wrapper.close()
+            if hasattr(backend.DatabaseWrapper, 'close_pools'):
+                backend.DatabaseWrapper.close_pools()
+        return connect / requests * 1e3, total / requests * 1e3
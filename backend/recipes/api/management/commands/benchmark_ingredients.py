@@ -0,0 +1,67 @@
+import csv
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.ingredient_index import IngredientIndex
+from api.serializers import IngredientSerializer
+from cookbook.models import Ingredient
+
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, '..', '..', 'data', 'ingredients.csv')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск ингредиентов через ORM (istartswith) '
+            'с индексом в памяти на данных из ingredients.csv. '
+            'Загруженные строки откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=DEFAULT_PATH)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with open(options['path'], encoding='utf-8') as file:
+            rows = [row for row in csv.reader(file) if len(row) == 2]
+        random.seed(0)
+        queries = [
+            name[:random.randint(1, 4)]
+            for name, unit in random.choices(rows, k=options['queries'])
+        ]
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in rows),
+                ignore_conflicts=True
+            )
+            orm_time = self.measure(queries, self.orm_search)
+            index = IngredientIndex()
+            started = time.perf_counter()
+            index.build()
+            build_time = time.perf_counter() - started
+            limit = options['limit']
+            index_time = self.measure(
+                queries, lambda query: index.search(query, limit))
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f'Ингредиентов: {len(rows)}, запросов: {len(queries)}')
+        self.stdout.write(
+            f'ORM: {orm_time * 1e3:.3f} мс на запрос')
+        self.stdout.write(
+            f'Индекс: {index_time * 1e6:.1f} мкс на запрос, '
+            f'построение {build_time * 1e3:.1f} мс')
+
+    def measure(self, queries, search):
+        started = time.perf_counter()
+        for query in queries:
+            search(query)
+        return (time.perf_counter() - started) / len(queries)
+
+    def orm_search(self, query):
+        ingredients = Ingredient.objects.filter(name__istartswith=query)
+        return IngredientSerializer(ingredients, many=True).data
@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class QueryCounter:
+    """Число SQL-запросов и их суммарное время в рамках одного запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+current_counter = ContextVar('current_counter', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.count += 1
+        counter.duration += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_counter(connection, **kwargs):
+    """Подключает счётчик к каждому соединению, в том числе к открытым
+    в потоках sync_to_async: счётчик запроса передаётся через contextvar."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.duration = 0.0
+        self.queries = 0
+        self.query_duration = 0.0
+
+    def observe(self, duration, queries, query_duration):
+        self.requests += 1
+        self.duration += duration
+        self.queries += queries
+        self.query_duration += query_duration
+        for index, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+
+
+class MetricsRegistry:
+    """Метрики по маршрутам и методам в памяти процесса."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, duration, queries, query_duration):
+        with self._lock:
+            stats = self._stats.get((route, method))
+            if stats is None:
+                stats = self._stats[(route, method)] = EndpointStats()
+            stats.observe(duration, queries, query_duration)
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        requests = [
+            '# HELP http_requests_total Number of requests.',
+            '# TYPE http_requests_total counter',
+        ]
+        durations = [
+            '# HELP http_request_duration_seconds Request latency.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        queries = [
+            '# HELP db_queries_total Number of SQL queries.',
+            '# TYPE db_queries_total counter',
+        ]
+        query_durations = [
+            '# HELP db_query_duration_seconds_total Time spent in SQL.',
+            '# TYPE db_query_duration_seconds_total counter',
+        ]
+        with self._lock:
+            items = sorted(
+                (key, vars(stats).copy(), list(stats.buckets))
+                for key, stats in self._stats.items())
+        for (route, method), stats, buckets in items:
+            labels = 'route="{0}",method="{1}"'.format(
+                escape(route), escape(method))
+            requests.append(
+                'http_requests_total{{{0}}} {1}'.format(
+                    labels, stats['requests']))
+            total = 0
+            for bound, count in zip(BUCKETS, buckets):
+                total += count
+                durations.append(
+                    'http_request_duration_seconds_bucket'
+                    '{{{0},le="{1}"}} {2}'.format(labels, bound, total))
+            durations.append(
+                'http_request_duration_seconds_bucket'
+                '{{{0},le="+Inf"}} {1}'.format(labels, stats['requests']))
+            durations.append(
+                'http_request_duration_seconds_sum{{{0}}} {1}'.format(
+                    labels, stats['duration']))
+            durations.append(
+                'http_request_duration_seconds_count{{{0}}} {1}'.format(
+                    labels, stats['requests']))
+            queries.append(
+                'db_queries_total{{{0}}} {1}'.format(
+                    labels, stats['queries']))
+            query_durations.append(
+                'db_query_duration_seconds_total{{{0}}} {1}'.format(
+                    labels, stats['query_duration']))
+        return '\n'.join(
+            requests + durations + queries + query_durations) + '\n'
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+registry = MetricsRegistry()
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Собирает число запросов, задержку и SQL-запросы по маршрутам.
+
+    Запросы, выполненные при отдаче StreamingHttpResponse, происходят
+    после выхода из middleware и не учитываются.
+    """
+    def observe(request, counter, started):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        route = match.route if match is not None else 'unresolved'
+        registry.observe(
+            route, request.method, duration,
+            counter.count, counter.duration)
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            counter = QueryCounter()
+            token = current_counter.set(counter)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current_counter.reset(token)
+            observe(request, counter, started)
+            return response
+    else:
+        def middleware(request):
+            install_query_counter(connection)
+            counter = QueryCounter()
+            token = current_counter.set(counter)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current_counter.reset(token)
+            observe(request, counter, started)
+            return response
+    return middleware
+
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    """Метрики в формате Prometheus, только для администраторов:
+    сборщик передаёт токен администратора в заголовке Authorization."""
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4')
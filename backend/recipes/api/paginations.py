@@ -1,8 +1,42 @@
+from django.db.models import QuerySet
 from rest_framework import pagination
 
 
+class KeysetPagination(pagination.CursorPagination):
+    page_size = 3
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+
 class CustomPagination(pagination.PageNumberPagination):
     page_size = 3
     page_size_query_param = 'limit'
     max_page_size = 50
     page_query_param = 'page'
+    mode_query_param = 'paginate'
+    cursor_pagination_class = KeysetPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """С ?paginate=cursor страницы отдаются по курсору без COUNT(*)
+        и OFFSET, иначе — по номеру страницы. Списки, ранжированные
+        не в базе, всегда разбиваются по номеру страницы, как и списки,
+        для которых view задаёт cursor_ordering = None: курсор строится
+        только по первому полю сортировки, и при тысячах одинаковых
+        значений страницы начинают повторяться."""
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                and isinstance(queryset, QuerySet)
+                and getattr(view, 'cursor_ordering', True) is not None):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
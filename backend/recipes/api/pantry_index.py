@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from cookbook.models import RecipeIngredient
+from cookbook.versions import bump_version, get_version
+
+
+def changes_key(version):
+    return f'pantry:changes:{version}'
+
+
+def without(posting, recipe_ids):
+    """posting без рецептов recipe_ids; оба массива отсортированы."""
+    positions = np.searchsorted(posting, recipe_ids)
+    found = positions < len(posting)
+    found[found] = posting[positions[found]] == recipe_ids[found]
+    if not found.any():
+        return posting
+    return np.delete(posting, positions[found])
+
+
+class PantryIndex:
+    """Обратный индекс ингредиентов в памяти процесса: для каждого
+    ингредиента — отсортированный массив рецептов с ним, для каждого
+    рецепта — число его ингредиентов.
+
+    Изменения рецептов записываются в кэш под последовательными
+    версиями RecipeIngredient. Перед поиском индекс перечитывает из базы
+    только рецепты из записей, которых ещё не видел, и строится заново,
+    если записей слишком много или часть из них уже вытеснена из кэша.
+    Изменения из других процессов видны, только если кэш общий.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def changed(self, *recipe_ids):
+        """Записывает изменение рецептов после фиксации транзакции."""
+        def log():
+            cache.set(changes_key(bump_version(RecipeIngredient)),
+                      recipe_ids, settings.PANTRY_INDEX_LOG_TIMEOUT)
+        transaction.on_commit(log)
+
+    def build(self):
+        version = get_version(RecipeIngredient)
+        links = np.array(
+            RecipeIngredient.objects.values_list('ingredient_id', 'recipe_id'),
+            dtype=np.int64).reshape(-1, 2)
+        links = np.unique(links, axis=0)
+        ingredient_ids, starts = np.unique(links[:, 0], return_index=True)
+        recipes = links[:, 1].astype(np.int32)
+        postings = dict(zip(
+            ingredient_ids.tolist(), np.split(recipes, starts[1:])))
+        counts = np.bincount(recipes).astype(np.int16)
+        self._data, self._version = (postings, counts), version
+        return self._data
+
+    def update(self, recipe_ids):
+        """Перечитывает из базы ингредиенты рецептов recipe_ids.
+
+        Поиск в других потоках продолжает работать со старыми
+        массивами: изменённые заменяются новыми, а не правятся на месте.
+        """
+        postings, counts = self._data
+        if not recipe_ids:
+            return self._data
+        recipe_ids = np.array(sorted(recipe_ids), dtype=np.int32)
+        added = {}
+        for ingredient_id, recipe_id in set(RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids.tolist()
+        ).values_list('ingredient_id', 'recipe_id')):
+            added.setdefault(ingredient_id, []).append(recipe_id)
+        postings = {
+            ingredient_id: without(posting, recipe_ids)
+            for ingredient_id, posting in postings.items()
+        }
+        for ingredient_id, new in added.items():
+            postings[ingredient_id] = np.union1d(
+                postings.get(ingredient_id, recipe_ids[:0]),
+                np.array(new, dtype=np.int32))
+        size = max(len(counts), int(recipe_ids[-1]) + 1)
+        counts = np.pad(counts, (0, size - len(counts)))
+        counts[recipe_ids] = 0
+        for new in added.values():
+            counts[new] += 1
+        return postings, counts
+
+    def refresh(self):
+        version = get_version(RecipeIngredient)
+        with self._lock:
+            if self._data is None or not (
+                    0 <= version - self._version
+                    <= settings.PANTRY_INDEX_MAX_CHANGES):
+                return self.build()
+            if version == self._version:
+                return self._data
+            keys = [changes_key(number)
+                    for number in range(self._version + 1, version + 1)]
+            logged = cache.get_many(keys)
+            if len(logged) < len(keys):
+                return self.build()
+            self._data = self.update(set().union(*logged.values()))
+            self._version = version
+            return self._data
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Рецепты, где есть хотя бы один из ingredient_ids.
+
+        Массив строк (рецепт, совпало, не хватает): сначала рецепты
+        с наибольшим числом совпавших ингредиентов, среди них — с
+        наименьшим числом недостающих, затем более новые.
+        """
+        postings, counts = self.refresh()
+        found = [postings[pk] for pk in ingredient_ids if pk in postings]
+        if not found:
+            return np.empty((0, 3), dtype=np.int64)
+        matched = np.bincount(np.concatenate(found), minlength=len(counts))
+        recipe_ids = np.flatnonzero(matched)
+        matched = matched[recipe_ids]
+        missing = counts[recipe_ids] - matched
+        if max_missing is not None:
+            keep = missing <= max_missing
+            recipe_ids, matched, missing = (
+                recipe_ids[keep], matched[keep], missing[keep])
+        order = np.lexsort((-recipe_ids, missing, -matched))
+        return np.column_stack((recipe_ids, matched, missing))[order]
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from cookbook.models import Ingredient, Recipe, Tag
+from cookbook.versions import bump_version, get_version
+from .replicas import cache_timeout
+
+
+def get_key(pk, request):
+    """Ключ общей для всех пользователей части рецепта.
+
+    Меняется при изменении рецепта, любого тега или ингредиента;
+    хост входит в ключ, так как ссылка на изображение абсолютная.
+    """
+    return 'recipe:{0}:{1}:{2}:{3}:{4}'.format(
+        pk, get_version(Recipe, pk), get_version(Tag),
+        get_version(Ingredient), request.get_host())
+
+
+def get(key):
+    return cache.get(key)
+
+
+def save(key, data):
+    """Сохраняет рецепт под ключом, прочитанным до построения ответа:
+    если рецепт изменился, пока ответ строился, версия в ключе уже
+    устарела и запись никто не прочитает."""
+    cache.set(key, data, cache_timeout())
+
+
+def overlay(data, flags):
+    """Подставляет в общую часть признаки текущего пользователя."""
+    data['is_favorited'] = flags['is_favorited']
+    data['is_in_shopping_cart'] = flags['is_in_shopping_cart']
+    data['author']['is_subscribed'] = flags['is_author_subscribed']
+    return data
+
+
+def invalidate(*pks):
+    """Сбрасывает кэш рецептов после фиксации транзакции, чтобы
+    параллельный запрос не сохранил данные до изменения."""
+    def bump():
+        for pk in pks:
+            bump_version(Recipe, pk)
+    transaction.on_commit(bump)
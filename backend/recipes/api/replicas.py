@@ -0,0 +1,138 @@
+"""Чтение из реплик для безопасных запросов к API.
+
+Middleware выбирает для GET, HEAD и OPTIONS случайную реплику из
+settings.DATABASE_REPLICAS, роутер направляет в неё чтение. После
+изменяющего запроса пользователь на REPLICA_PIN_SECONDS секунд читает
+только из основной базы, чтобы сразу видеть свои изменения.
+
+Отметка об этом хранится в кэше по умолчанию. Следующий запрос может
+попасть в другой воркер, поэтому с репликами кэш должен быть общим
+для процессов: иначе проверка api.E001 не даёт запустить проект.
+"""
+import asyncio
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+from cookbook.versions import is_cache_shared
+
+PRIMARY = 'default'
+
+
+class ReadState:
+    """База для чтения в рамках одного HTTP-запроса.
+
+    Изменяемый объект, а не значение contextvar: признак, выставленный
+    в потоке sync_to_async, должен быть виден всему запросу.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+
+current_state = ContextVar('replica_state', default=None)
+
+
+def pin_key(user_id):
+    return 'primary_pin:{0}'.format(user_id)
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def use_primary_if_pinned(user_id):
+    """Переключает текущий запрос на основную базу, если пользователь
+    недавно что-то изменял."""
+    state = current_state.get()
+    if state is not None and state.database is not None:
+        if cache.get(pin_key(user_id)):
+            state.database = None
+
+
+def cache_timeout():
+    """Время жизни кэша для данных, прочитанных в текущем запросе.
+
+    Реплика может отставать: данные, прочитанные из неё после повышения
+    версии, иначе остались бы в кэше до следующего изменения.
+    """
+    state = current_state.get()
+    if state is None or state.database is None:
+        return DEFAULT_TIMEOUT
+    return settings.REPLICA_PIN_SECONDS
+
+
+def choose_database(request):
+    if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS:
+        return random.choice(settings.DATABASE_REPLICAS)
+    return None
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    def after(request, response):
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and user is not None and user.is_authenticated):
+            pin_to_primary(user.id)
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current_state.set(ReadState(choose_database(request)))
+            try:
+                response = await get_response(request)
+            finally:
+                current_state.reset(token)
+            after(request, response)
+            return response
+    else:
+        def middleware(request):
+            token = current_state.set(ReadState(choose_database(request)))
+            try:
+                response = get_response(request)
+            finally:
+                current_state.reset(token)
+            after(request, response)
+            return response
+    return middleware
+
+
+class ReplicaRouter:
+    """Чтение — из выбранной middleware реплики, запись и миграции —
+    в основную базу. Токены всегда читаются из основной базы: только что
+    выданный токен может ещё не дойти до реплики."""
+
+    def db_for_read(self, model, **hints):
+        state = current_state.get()
+        if state is None or state.database is None or model is Token:
+            return PRIMARY
+        return state.database
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+@checks.register()
+def check_replica_pin_cache(app_configs, **kwargs):
+    if not settings.DATABASE_REPLICAS or is_cache_shared():
+        return []
+    return [checks.Error(
+        'DB_REPLICAS задан, но кэш по умолчанию не общий для процессов: '
+        'воркер, не обрабатывавший изменение, не увидит отметку и будет '
+        'читать из отстающей реплики.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION общего кэша, '
+             'например Memcached.',
+        id='api.E001')]
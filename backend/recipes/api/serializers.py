@@ -1,24 +1,74 @@
 import base64
-
-from django.shortcuts import get_object_or_404
-from django.core.files.base import ContentFile
+import binascii
+import hashlib
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import Http404
 from django.core.validators import MinValueValidator
 
 from rest_framework import serializers
 
+from cookbook import cart_totals
 from cookbook.models import (
     User, Recipe, Tag, RecipeIngredient, Favourite, Cart,
     Ingredient, Follow)
 
 
 class Base64ImageField(serializers.ImageField):
+    """Изображение в виде data URI.
+
+    Декодируется частями во временный файл с проверкой размера и
+    сохраняется под именем из хэша содержимого: повторно присланный
+    тот же файл не записывается заново.
+    """
+    default_error_messages = {
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+        'invalid_base64': 'Некорректное изображение в base64.',
+    }
+    chunk_size = 64 * 1024
+
+    def __init__(self, *args, upload_to='', max_size=None, **kwargs):
+        self.upload_to = upload_to
+        self.max_size = max_size or settings.IMAGE_MAX_SIZE
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if not ext.isalnum():
+                self.fail('invalid_image')
+            if len(imgstr) // 4 * 3 > self.max_size:
+                self.fail('max_size', max_size=self.max_size)
+            file, digest = self.decode(imgstr)
+            name = '{0}.{1}'.format(digest, ext)
+            path = os.path.join(self.upload_to, name)
+            if default_storage.exists(path):
+                file.close()
+                return path
+            data = File(file, name=name)
         return super(Base64ImageField, self).to_internal_value(data)
 
+    def decode(self, imgstr):
+        file = SpooledTemporaryFile(max_size=self.chunk_size)
+        sha256 = hashlib.sha256()
+        for start in range(0, len(imgstr), self.chunk_size):
+            try:
+                chunk = base64.b64decode(
+                    imgstr[start:start + self.chunk_size], validate=True)
+            except binascii.Error:
+                file.close()
+                self.fail('invalid_base64')
+            sha256.update(chunk)
+            file.write(chunk)
+        file.seek(0)
+        return file, sha256.hexdigest()
+
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -27,6 +77,8 @@ class UserSerializer(serializers.ModelSerializer):
     )
 
     def subscription(self, instance):
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
         try:
             user = self.context['request'].user
         except Exception:
@@ -51,6 +103,14 @@ class PasswordSerializer(serializers.Serializer):
     current_password = serializers.CharField(max_length=150)
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
 class AuthorSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -104,17 +164,23 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
         method_name='is_in_favourites', read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name='is_in_cart', read_only=True)
-    image = Base64ImageField(max_length=None)
+    image = Base64ImageField(
+        max_length=None, upload_to=Recipe.image.field.upload_to)
     tags = TagsField(
         queryset=Tag.objects.all(),
         many=True
     )
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipeingredient_set.all()
+        if 'recipeingredient_set' not in getattr(
+                obj, '_prefetched_objects_cache', {}):
+            ingredients = ingredients.select_related('ingredient')
         return IngredientsSerializer(ingredients, many=True).data
 
     def is_in_favourites(self, instance):
+        if hasattr(instance, 'is_favorited'):
+            return instance.is_favorited
         user_id = self.context['request'].user.id
         recipe_id = instance.id
         try:
@@ -124,6 +190,8 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
             return False
 
     def is_in_cart(self, instance):
+        if hasattr(instance, 'is_in_shopping_cart'):
+            return instance.is_in_shopping_cart
         user_id = self.context['request'].user.id
         recipe_id = instance.id
         try:
@@ -142,65 +210,92 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         ingredients = self.initial_data.get('ingredients')
-        ingredient_list = []
-        for ingredient_item in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_item['id']
+        ingredient_ids = [int(item['id']) for item in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Ингредиент уже добавлен'
             )
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ингредиент уже добавлен'
-                )
-            ingredient_list.append(ingredient)
-            if int(ingredient_item['amount']) <= 0:
+        existing = Ingredient.objects.in_bulk(ingredient_ids)
+        if len(existing) != len(ingredient_ids):
+            raise Http404('Ингредиент не найден.')
+        amounts = {}
+        for ingredient_id, ingredient_item in zip(ingredient_ids, ingredients):
+            amount = int(ingredient_item['amount'])
+            if amount <= 0:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть 1 или более.'
                 )
-        data['ingredients'] = ingredients
+            amounts[ingredient_id] = amount
+        data['ingredients'] = amounts
         return data
 
+    def set_ingredients(self, recipe, amounts):
+        """Приводит ингредиенты рецепта к переданному набору.
+
+        Удаляет, обновляет и добавляет только изменившиеся строки
+        RecipeIngredient, каждое действие одним запросом, и переносит
+        разницу в суммы корзин, где лежит рецепт.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        to_delete = []
+        deltas = {}
+        for ingredient_id, item in current.items():
+            if ingredient_id not in amounts:
+                to_delete.append(item.id)
+                deltas[ingredient_id] = -item.amount
+        to_update = []
+        to_create = []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+                deltas[ingredient_id] = amount
+            elif item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                to_update.append(item)
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        cart_totals.change_recipe(recipe, deltas)
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
+        amounts = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for ingredient_data in ingredients_data:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_data.get('id')
-            )
-            amount = int(ingredient_data.get('amount'))
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=amount
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
-        for tag in tags:
-            recipe.tags.add(tag)
+            for ingredient_id, amount in amounts.items()
+        )
+        recipe.tags.add(*tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
+        amounts = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = instance
         recipe.name = validated_data.get('name')
         recipe.text = validated_data.get('text')
         recipe.cooking_time = validated_data.get('cooking_time')
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-        recipe.tags.clear()
-        for ingredient_data in ingredients_data:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_data.get('id')
-            )
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=ingredient_data.get('amount')
-            )
-        for tag in tags:
-            recipe.tags.add(tag)
-        recipe.save()
+        update_fields = ['name', 'text', 'cooking_time', 'updated']
+        if 'image' in validated_data:
+            recipe.image = validated_data['image']
+            update_fields.append('image')
+        recipe.save(update_fields=update_fields)
+        self.set_ingredients(recipe, amounts)
+        recipe.tags.set(tags)
         return recipe
 
 
@@ -208,6 +303,11 @@ class ReadRecipeSerializer(WriteRecipeSerializer):
     author = UserSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True)
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
     class Meta:
         model = Recipe
         fields = [
@@ -234,21 +334,30 @@ class FollowSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField(
         method_name='get_recipes'
     )
-    recipe_count = serializers.IntegerField(
-       source='following.recipes.count()',
-       read_only=True
+    recipes_count = serializers.SerializerMethodField(
+        method_name='get_recipes_count'
     )
 
     def get_recipes(self, instance):
         author = instance.following
-        recipes = author.recipes.all()
-        limit = self.context['request'].query_params.get('recipes_limit')
-        if limit:
-            recipes = author.recipes.all()[:int(limit)]
+        if hasattr(author, 'limited_recipes'):
+            recipes = author.limited_recipes
+        else:
+            recipes = author.recipes.all()
+            limit = self.context['request'].query_params.get('recipes_limit')
+            if limit:
+                recipes = author.recipes.all()[:int(limit)]
         return CartSerializer(recipes, many=True).data
 
+    def get_recipes_count(self, instance):
+        if hasattr(instance, 'recipes_count'):
+            return instance.recipes_count
+        return instance.following.recipes.count()
+
     def subscription(self, instance):
         user = self.context['request'].user
+        if instance.user_id == user.id:
+            return True
         author = instance.following
         try:
             return Follow.objects.filter(
@@ -260,7 +369,7 @@ class FollowSerializer(serializers.ModelSerializer):
         model = Follow
         fields = [
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'recipes', 'recipe_count'
+            'last_name', 'is_subscribed', 'recipes', 'recipes_count'
         ]
 
 
@@ -0,0 +1,67 @@
+import csv
+import json
+
+from django.db.models import F
+
+from cookbook.models import CartIngredientTotal
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=UTF-8',
+    'json': 'application/json; charset=UTF-8',
+}
+
+
+def get_shopping_list(user):
+    """Суммарное количество каждого ингредиента из корзины пользователя.
+
+    Читается из CartIngredientTotal, которую поддерживает
+    cookbook.cart_totals.
+    """
+    return CartIngredientTotal.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        total=F('amount')
+    ).order_by('ingredient__name')
+
+
+def render_txt(items):
+    for item in items:
+        yield '{0} ({1}) - {2}\n'.format(
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total'])
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for item in items:
+        yield writer.writerow([
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total']])
+
+
+def render_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['total'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'json': render_json,
+}
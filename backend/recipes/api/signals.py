@@ -0,0 +1,101 @@
+from django.core.signals import request_finished, request_started
+from django.db import connections, transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from cookbook.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from cookbook import cart_totals, search
+from cookbook.versions import bump_version
+from . import recipe_cache
+from .authentication import token_cache
+from .connections import health_check, mark_used
+from .pantry_index import pantry_index
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def bump_reference_version(sender, **kwargs):
+    """Версия повышается после фиксации транзакции, иначе другой
+    процесс может перечитать по новой версии ещё старые данные."""
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    recipe_cache.invalidate(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_cart_totals(instance, **kwargs):
+    """Строки корзины удаляются каскадом, минуя CartView."""
+    cart_totals.change_recipe(instance, {
+        ingredient_id: -total for ingredient_id, total
+        in cart_totals.recipe_amounts([instance.pk]).items()
+    })
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_index(instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        search.update_index(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_search_index(instance, **kwargs):
+    search.remove_from_index(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    recipe_cache.invalidate(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_pantry_index(instance, **kwargs):
+    pantry_index.changed(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def update_pantry_index_ingredients(instance, **kwargs):
+    pantry_index.changed(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_cache.invalidate(instance.pk)
+    elif pk_set:
+        recipe_cache.invalidate(*pk_set)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, **kwargs):
+    recipe_cache.invalidate(
+        *instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user_token(instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(request_started)
+def check_database_connections(**kwargs):
+    for connection in connections.all():
+        health_check(connection)
+
+
+@receiver(request_finished)
+def mark_database_connections_used(**kwargs):
+    for connection in connections.all():
+        if connection.connection is not None:
+            mark_used(connection)
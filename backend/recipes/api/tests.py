@@ -0,0 +1,223 @@
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from psycopg2 import pool as psycopg2_pool
+from rest_framework.authtoken.models import Token
+
+from cookbook.models import (Follow, Ingredient, Recipe, Tag, TimelineEntry,
+                             User)
+from cookbook.versions import bump_version
+from recipes.postgresql_pool.base import BlockingConnectionPool
+from .connections import health_check, mark_used
+from .ingredient_index import IngredientIndex
+
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwC'
+         'AAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=')
+
+
+def create_user(username, **fields):
+    return User.objects.create(
+        username=username, email=f'{username}@example.com',
+        password='password', **fields)
+
+
+def login(client, user):
+    token, _ = Token.objects.get_or_create(user=user)
+    client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+
+
+class MetricsTests(TestCase):
+    url = '/api/metrics/'
+
+    def create_client(self, **fields):
+        login(self.client, create_user(fields.pop('username'), **fields))
+
+    def test_anonymous_is_rejected(self):
+        response = self.client.get(self.url)
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_regular_user_is_rejected(self):
+        self.create_client(username='user')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_admin_gets_metrics(self):
+        self.create_client(username='admin', is_staff=True)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), FEED_FANOUT_LIMIT=1)
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+
+    def create_recipe(self):
+        login(self.client, self.author)
+        return self.client.post('/api/recipes/', {
+            'name': 'Омлет', 'text': 'Взбить и пожарить.',
+            'cooking_time': 10, 'image': IMAGE,
+            'tags': [Tag.objects.create(
+                name='Завтрак', color='#E26C2D', slug='breakfast').id],
+            'ingredients': [{'id': Ingredient.objects.create(
+                name='яйца', measurement_unit='шт').id, 'amount': 2}],
+        }, content_type='application/json')
+
+    def test_create_recipe_without_followers(self):
+        response = self.create_recipe()
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_unfollow_back_under_fanout_limit(self):
+        reader, other = create_user('reader'), create_user('other')
+        for user in (reader, other):
+            login(self.client, user)
+            self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        recipe = Recipe.objects.get(id=self.create_recipe().data['id'])
+        self.assertFalse(TimelineEntry.objects.exists())
+        login(self.client, other)
+        self.assertEqual(
+            self.client.delete(
+                f'/api/users/{self.author.id}/subscribe/').status_code, 204)
+        self.assertEqual(
+            list(Follow.objects.values_list('user_id', flat=True)),
+            [reader.id])
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=reader, recipe=recipe).exists())
+        login(self.client, reader)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(
+            [item['id'] for item in response.data['results']], [recipe.id])
+
+
+class SubscriptionsTests(TestCase):
+    url = '/api/users/subscriptions/'
+
+    def setUp(self):
+        self.reader = create_user('reader')
+        login(self.client, self.reader)
+
+    def get_recipes(self):
+        response = self.client.get(self.url, {'recipes_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        return [[recipe['id'] for recipe in item['recipes']]
+                for item in response.data['results']]
+
+    def test_without_subscriptions(self):
+        self.assertEqual(self.get_recipes(), [])
+
+    def test_recipes_limit(self):
+        author = create_user('author')
+        Follow.objects.create(user=self.reader, following=author)
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                image='cookbook/recipe.png', cooking_time=10).id
+            for number in range(3)]
+        self.assertEqual(self.get_recipes(), [recipes[:0:-1]])
+
+
+class PopularOrderingTests(TestCase):
+    def test_cursor_pagination_is_not_used(self):
+        author = create_user('author')
+        for number in range(5):
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                image='cookbook/recipe.png', cooking_time=10)
+        seen = []
+        url = '/api/recipes/?ordering=popular&paginate=cursor&limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 5)
+            seen += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(
+            seen, sorted(Recipe.objects.values_list('id', flat=True),
+                         reverse=True))
+
+
+class IngredientIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.index = IngredientIndex()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def search(self, query):
+        return [row['name'] for row in self.index.search(query, 10)]
+
+    def test_rebuilt_after_version_bump(self):
+        self.assertEqual(self.search('со'), ['соль'])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='соус', measurement_unit='мл')])
+        self.assertEqual(self.search('со'), ['соль'])
+        bump_version(Ingredient)
+        self.assertEqual(self.search('со'), ['соль', 'соус'])
+
+    def test_rebuilt_after_commit(self):
+        self.assertEqual(self.search('со'), ['соль'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name='соль').get().delete()
+        self.assertEqual(self.search('со'), [])
+
+
+@mock.patch('psycopg2.pool.psycopg2.connect',
+            side_effect=lambda *args, **kwargs: mock.Mock(closed=False))
+class BlockingConnectionPoolTests(SimpleTestCase):
+    def test_exhausted_pool_times_out(self, connect):
+        pool = BlockingConnectionPool(0, 1, timeout=0.05)
+        pool.getconn()
+        with self.assertRaises(psycopg2_pool.PoolError):
+            pool.getconn()
+
+    def test_exhausted_pool_waits_for_returned_connection(self, connect):
+        pool = BlockingConnectionPool(1, 1, timeout=5)
+        first = pool.getconn()
+        threading.Timer(0.05, pool.putconn, (first,)).start()
+        self.assertIs(pool.getconn(), first)
+
+    def test_concurrent_checkouts_do_not_fail(self, connect):
+        pool = BlockingConnectionPool(0, 2, timeout=5)
+        errors = []
+
+        def request():
+            try:
+                connection = pool.getconn()
+                time.sleep(0.01)
+                pool.putconn(connection)
+            except psycopg2_pool.PoolError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+@override_settings(DB_HEALTH_CHECK_IDLE=10)
+class HealthCheckTests(SimpleTestCase):
+    def create_connection(self):
+        return mock.Mock(
+            settings_dict={'CONN_HEALTH_CHECKS': True},
+            in_atomic_block=False, **{'is_usable.return_value': False})
+
+    def test_recently_used_connection_is_not_pinged(self):
+        connection = self.create_connection()
+        mark_used(connection)
+        health_check(connection)
+        connection.is_usable.assert_not_called()
+        connection.close.assert_not_called()
+
+    def test_idle_broken_connection_is_closed(self):
+        connection = self.create_connection()
+        connection.last_used = time.monotonic() - 60
+        health_check(connection)
+        connection.close.assert_called_once()
@@ -2,7 +2,10 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (RecipeViewSet, UserViewSet, get_token, delete_token,
-                    TagViewSet, CartView, FollowView, IngredientViewSet,)
+                    TagViewSet, CartView, FollowView, IngredientViewSet,
+                    CartBatchView,)
+from . import async_views
+from .metrics import metrics
 
 router_v1 = DefaultRouter()
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
@@ -16,9 +19,20 @@ auth = [
     path('logout/', delete_token, name='delete_token'),
 ]
 
+async_urls = [
+    path('recipes/', async_views.recipe_list),
+    path('recipes/<int:pk>/', async_views.recipe_detail),
+    path('tags/', async_views.tag_list),
+    path('ingredients/', async_views.ingredient_list),
+    path('users/subscriptions/', async_views.subscriptions),
+]
+
 urlpatterns = [
+    path('async/', include(async_urls)),
     path('', include(router_v1.urls)),
     path('auth/token/', include(auth)),
+    path('metrics/', metrics, name='metrics'),
+    path('recipes/<str:action>/batch/', CartBatchView.as_view()),
     path('recipes/<pk>/<str:action>/', CartView.as_view()),
     path('users/<pk>/subscribe/', FollowView.as_view()),
 ]
@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Prefetch, Value,
+    prefetch_related_objects)
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import (
     viewsets, mixins, status, exceptions, filters)
@@ -9,16 +14,23 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
+from cookbook import cart_totals, timelines
 from cookbook.models import (
     Recipe, User, Tag, Cart, Favourite, Follow, Ingredient,
-    RecipeIngredient)
+    RecipeIngredient, ShoppingListExport)
+from . import exports, recipe_cache
+from .cache import CachedReadMixin
 from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .pantry_index import pantry_index
 from .permissions import AuthorOrReadOnly
 from .paginations import CustomPagination
+from .shopping_list import CONTENT_TYPES, RENDERERS, get_shopping_list
 from .serializers import (
     UserSerializer, PasswordSerializer, GetTokenSerializer,
     TagSerializer, WriteRecipeSerializer, CartSerializer,
-    FollowSerializer, IngredientSerializer, ReadRecipeSerializer)
+    FollowSerializer, IngredientSerializer, ReadRecipeSerializer,
+    RecipeIdsSerializer)
 
 
 class CreateListRetrieveViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
@@ -32,6 +44,7 @@ class UserViewSet(CreateListRetrieveViewSet):
     serializer_class = UserSerializer
     permission_classes = (AllowAny,)
     pagination_class = CustomPagination
+    cursor_ordering = ('-id',)
 
     @action(detail=False,
             methods=['GET', ],
@@ -63,111 +76,328 @@ class UserViewSet(CreateListRetrieveViewSet):
             url_path='subscriptions',
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        follows = request.user.follower.all()
+        follows = request.user.follower.select_related(
+            'following'
+        ).annotate(
+            recipes_count=Count('following__recipes')
+        ).order_by('-id')
         page = self.paginate_queryset(follows)
-        if page is not None:
-            serializer = FollowSerializer(
-                page, many=True, context=self.get_serializer_context())
-            return self.get_paginated_response(serializer.data)
+        follows = list(follows if page is None else page)
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.filter(author_id__in=[
+                follow.following_id for follow in follows
+            ]).newest_per_author(int(limit))
+        prefetch_related_objects(follows, Prefetch(
+            'following__recipes', queryset=recipes,
+            to_attr='limited_recipes'))
         serializer = FollowSerializer(
             follows, many=True, context=self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
         return Response(serializer.data)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
     # serializer_class = WriteRecipeSerializer
     permission_classes = (AuthorOrReadOnly,)
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
 
+    @property
+    def cursor_ordering(self):
+        # У тысяч рецептов одинаковый favorites_count, курсор по нему
+        # зацикливается, поэтому popular разбивается по номеру страницы.
+        if self.request.query_params.get('ordering') == 'popular':
+            return None
+        return ('-pub_date', '-id')
+
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+        if self.request.query_params.get('ordering') == 'popular':
+            queryset = queryset.order_by('-favorites_count', '-id')
+        return self.annotate_flags(queryset)
+
+    def annotate_flags(self, queryset):
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(Favourite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(Cart.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_author_subscribed=Exists(Follow.objects.filter(
+                    user=user, following=OuterRef('author'))),
+            )
+        else:
+            not_set = Value(False, output_field=BooleanField())
+            queryset = queryset.annotate(
+                is_favorited=not_set,
+                is_in_shopping_cart=not_set,
+                is_author_subscribed=not_set,
+            )
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs['pk']
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        pk = int(pk)
+        key = recipe_cache.get_key(pk, request)
+        data = recipe_cache.get(key)
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            recipe_cache.save(key, response.data)
+            return response
+        if request.user.is_authenticated:
+            flags = self.annotate_flags(Recipe.objects.filter(pk=pk)).values(
+                'is_favorited', 'is_in_shopping_cart', 'is_author_subscribed'
+            ).first()
+            if flags is None:
+                raise Http404
+        else:
+            flags = dict.fromkeys(
+                ('is_favorited', 'is_in_shopping_cart',
+                 'is_author_subscribed'), False)
+        return Response(recipe_cache.overlay(data, flags))
+
     def get_serializer_class(self):
         if self.request.method in ['GET']:
             return ReadRecipeSerializer
         return WriteRecipeSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        timelines.fan_out(recipe)
+
+    @action(detail=False,
+            methods=['GET', ],
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Рецепты авторов из подписок, от новых к старым."""
+        queryset = self.filter_queryset(
+            timelines.filter_feed(self.get_queryset(), request.user))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False,
             methods=['GET', ],
-            url_path='download_shopping_cart')
+            permission_classes=(AllowAny,))
+    def pantry(self, request):
+        """Что приготовить из ингредиентов ?ingredients=<id>&...:
+        сначала рецепты, где совпало больше ингредиентов, затем те,
+        где меньше недостающих. ?max_missing ограничивает недостающие."""
+        ingredient_ids = request.query_params.getlist('ingredients')
+        max_missing = request.query_params.get('max_missing', '')
+        if not ingredient_ids or not all(
+                pk.isdigit() for pk in ingredient_ids + [max_missing or '0']):
+            response = {'errors': 'Укажите id ингредиентов и неотрицательное '
+                                  'число недостающих'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        ranking = pantry_index.search(
+            {int(pk) for pk in ingredient_ids},
+            int(max_missing) if max_missing else None)
+        page = [row.tolist() for row in self.paginate_queryset(ranking)]
+        recipes = self.get_queryset().in_bulk([row[0] for row in page])
+        page = [row for row in page if row[0] in recipes]
+        data = self.get_serializer(
+            [recipes[row[0]] for row in page], many=True).data
+        for item, (_, matched, missing) in zip(data, page):
+            item['ingredients_matched'] = matched
+            item['ingredients_missing'] = missing
+        return self.get_paginated_response(data)
+
+    @action(detail=True,
+            methods=['GET', ],
+            permission_classes=(AllowAny,))
+    def similar(self, request, pk=None):
+        """Похожие рецепты из таблицы, которую заполняет
+        update_similar_recipes, от более похожих к менее похожим."""
+        if not pk.isdigit():
+            raise Http404
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), settings.SIMILAR_RECIPES_K) if (
+            limit.isdigit()) else 10
+        recipes = list(Recipe.objects.filter(
+            similar_to__recipe_id=pk
+        ).order_by('-similar_to__score', 'id')[:limit])
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(CartSerializer(recipes, many=True).data)
+
+    @action(detail=False,
+            methods=['GET', ],
+            url_path='download_shopping_cart',
+            permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        filename = 'test.txt'
-        carts = request.user.cart.all()
-        dict_amount = {}
-        dict_unit = {}
-        for cart in carts:
-            recipe = cart.recipe
-            for ingredient in recipe.ingredients.all():
-                dict_unit[ingredient.name] = ingredient.measurement_unit
-                amount_storage = get_object_or_404(
-                    RecipeIngredient, recipe=recipe, ingredient=ingredient)
-                amount = amount_storage.amount
-                existing = dict_amount.get(ingredient.name)
-                if existing:
-                    dict_amount[ingredient.name] = (
-                        int(amount) + int(existing))
-                else:
-                    dict_amount[ingredient.name] = int(amount)
-        str_final = ''
-        for i in range(0, len(dict_amount)):
-            new_str = (
-                str(list(dict_amount.keys())[i]) + ' (' +
-                str(dict_unit[list(dict_amount.keys())[i]]) +
-                ') - ' + str(list(dict_amount.values())[i]))
-            str_final = str_final + new_str + '\n'
-        response = HttpResponse(
-            str_final, content_type='text/plain; charset=UTF-8')
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format in exports.RENDERERS:
+            return self.export_shopping_cart(request, file_format)
+        if file_format not in RENDERERS:
+            response = {'errors': 'Неподдерживаемый формат файла'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        items = get_shopping_list(request.user).iterator()
+        response = StreamingHttpResponse(
+            RENDERERS[file_format](items),
+            content_type=CONTENT_TYPES[file_format])
         response['Content-Disposition'] = (
-            'attachment; filename={0}'.format(filename))
+            'attachment; filename=shopping_list.{0}'.format(file_format))
         return response
 
+    def export_shopping_cart(self, request, file_format):
+        """PDF и CSV строятся в фоне: пока файл не готов, ответ 202,
+        клиент повторяет тот же запрос."""
+        export = exports.request_export(
+            get_shopping_list(request.user), file_format)
+        if export.status == ShoppingListExport.DONE:
+            return FileResponse(
+                export.file.open('rb'), as_attachment=True,
+                filename='shopping_list.{0}'.format(file_format))
+        return Response(
+            {'status': export.status}, status=status.HTTP_202_ACCEPTED,
+            headers={'Retry-After': '1'})
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
+CART_COUNTERS = {
+    'shopping_cart': (Cart, 'in_carts_count'),
+    'favorite': (Favourite, 'favorites_count'),
+}
+
+
+def lock_lists(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Добавления и удаления в корзине и избранном одного пользователя
+    идут по очереди: иначе параллельный запрос может добавить или
+    удалить рецепт между чтением набора и записью, и счётчики рецептов
+    и суммы корзины будут изменены дважды.
+    """
+    list(User.objects.select_for_update(no_key=True).filter(
+        pk=user.pk).values_list('pk', flat=True))
+
+
 class CartView(APIView):
+    counters = CART_COUNTERS
+
     def post(self, request, *args, **kwargs):
         recipe_id = self.kwargs.get('pk')
         recipe = get_object_or_404(Recipe, id=recipe_id)
         user = request.user
         action = self.kwargs.get('action')
-        if action == 'shopping_cart':
-            try:
-                Cart.objects.create(recipe=recipe, user=user)
-            except Exception:
-                response = {'errors': 'Этот объект уже добавлен'}
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
-        elif action == 'favorite':
-            try:
-                Favourite.objects.create(recipe=recipe, user=user)
-            except Exception:
-                response = {'errors': 'Этот объект уже добавлен'}
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
-        else:
+        if action not in self.counters:
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        model, counter = self.counters[action]
+        try:
+            with transaction.atomic():
+                lock_lists(user)
+                model.objects.create(recipe=recipe, user=user)
+                Recipe.objects.filter(id=recipe.id).update(
+                    **{counter: F(counter) + 1})
+                if model is Cart:
+                    cart_totals.add_recipes(user.id, [recipe.id])
+        except IntegrityError:
+            response = {'errors': 'Этот объект уже добавлен'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
         serializer = CartSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, *args, **kwargs):
         action = self.kwargs.get('action')
-        if action == 'shopping_cart':
-            object = request.user.cart.all()
-        elif action == 'favorite':
-            object = request.user.favourite.all()
-        else:
+        if action not in self.counters:
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        model, counter = self.counters[action]
         recipe_id = self.kwargs.get('pk')
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        object.filter(recipe=recipe).delete()
+        with transaction.atomic():
+            lock_lists(request.user)
+            deleted, _ = model.objects.filter(
+                user=request.user, recipe=recipe).delete()
+            if deleted:
+                Recipe.objects.filter(id=recipe.id).update(
+                    **{counter: F(counter) - deleted})
+                if model is Cart:
+                    cart_totals.add_recipes(
+                        request.user.id, [recipe.id], sign=-1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class CartBatchView(APIView):
+    """Добавление и удаление нескольких рецептов за один запрос."""
+    counters = CART_COUNTERS
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return set(serializer.validated_data['recipes'])
+
+    def post(self, request, *args, **kwargs):
+        action = self.kwargs.get('action')
+        if action not in self.counters:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        model, counter = self.counters[action]
+        recipe_ids = self.get_recipe_ids(request)
+        with transaction.atomic():
+            lock_lists(request.user)
+            existing = set(Recipe.objects.filter(
+                id__in=recipe_ids).values_list('id', flat=True))
+            present = set(model.objects.filter(
+                user=request.user, recipe_id__in=existing
+            ).values_list('recipe_id', flat=True))
+            added = existing - present
+            model.objects.bulk_create(
+                [model(user=request.user, recipe_id=recipe_id)
+                 for recipe_id in added])
+            Recipe.objects.filter(id__in=added).update(
+                **{counter: F(counter) + 1})
+            if model is Cart:
+                cart_totals.add_recipes(request.user.id, added)
+        return Response({
+            'added': sorted(added),
+            'already_present': sorted(present),
+            'missing': sorted(recipe_ids - existing),
+        })
+
+    def delete(self, request, *args, **kwargs):
+        action = self.kwargs.get('action')
+        if action not in self.counters:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        model, counter = self.counters[action]
+        recipe_ids = self.get_recipe_ids(request)
+        with transaction.atomic():
+            lock_lists(request.user)
+            objects = model.objects.filter(
+                user=request.user, recipe_id__in=recipe_ids)
+            removed = set(objects.values_list('recipe_id', flat=True))
+            objects.filter(recipe_id__in=removed).delete()
+            Recipe.objects.filter(id__in=removed).update(
+                **{counter: F(counter) - 1})
+            if model is Cart:
+                cart_totals.add_recipes(request.user.id, removed, sign=-1)
+            existing = set(Recipe.objects.filter(
+                id__in=recipe_ids - removed).values_list('id', flat=True))
+        return Response({
+            'removed': sorted(removed),
+            'not_present': sorted(existing),
+            'missing': sorted(recipe_ids - removed - existing),
+        })
+
+
 class FollowView(APIView):
     def get_serializer_context(self):
         return {
@@ -185,6 +415,8 @@ class FollowView(APIView):
         except Exception:
             response = {'errors': 'Подписка невозможна!'}
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        timelines.update_pull_author(following.id)
+        timelines.backfill(user.id, [following.id])
         serializer = FollowSerializer(
             follow, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -194,19 +426,32 @@ class FollowView(APIView):
         following_id = self.kwargs.get('pk')
         following = get_object_or_404(User, id=following_id)
         objects.filter(following=following).delete()
+        timelines.remove(request.user.id, following.id)
+        timelines.update_pull_author(following.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
     pagination_class = None
 
+    @action(detail=False,
+            methods=['GET', ],
+            url_path='autocomplete')
+    def autocomplete(self, request):
+        name = request.query_params.get('name', '')
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), 50) if limit.isdigit() else 10
+        if not name:
+            return Response([])
+        return Response(ingredient_index.search(name, limit))
+
 
 def get_tokens_for_user(user):
-    token = Token.objects.create(user=user)
+    token, created = Token.objects.get_or_create(user=user)
     return {
         'auth_token': str(token.key),
     }
@@ -14,11 +14,11 @@ class IngredientAdmin(ImportExportModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'times_added')
+    list_select_related = ('author',)
     list_filter = ('author', 'name', 'tags')
 
     def times_added(self, obj):
-        favorites = Favourite.objects.filter(recipe=obj)
-        return favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(User)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CookbookConfig(AppConfig):
     name = 'cookbook'
+
+    def ready(self):
+        from . import versions  # noqa: F401
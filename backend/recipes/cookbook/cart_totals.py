@@ -0,0 +1,59 @@
+"""Приращения для CartIngredientTotal.
+
+Каждое изменение — три запроса независимо от числа пользователей:
+вставка недостающих строк с нулём, одно UPDATE с CASE по ингредиентам
+и удаление обнулившихся строк. Прибавление через F() безопасно при
+одновременных изменениях корзины.
+"""
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import Cart, CartIngredientTotal, RecipeIngredient
+
+
+def recipe_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by().values('ingredient_id').annotate(
+        total=Sum('amount')
+    ).values_list('ingredient_id', 'total'))
+
+
+def apply(user_ids, deltas):
+    """Прибавляет deltas ({ingredient_id: приращение}) к суммам
+    каждого из пользователей user_ids."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    CartIngredientTotal.objects.bulk_create(
+        [CartIngredientTotal(user_id=user_id, ingredient_id=ingredient_id)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0],
+        batch_size=1000, ignore_conflicts=True)
+    totals = CartIngredientTotal.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    totals.update(amount=F('amount') + Case(
+        *(When(ingredient_id=ingredient_id, then=Value(delta))
+          for ingredient_id, delta in deltas.items()),
+        output_field=IntegerField()))
+    totals.filter(amount__lte=0).delete()
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    """Учитывает рецепты, добавленные в корзину (sign=-1 — удалённые)."""
+    if recipe_ids:
+        apply([user_id], {
+            ingredient_id: sign * total
+            for ingredient_id, total in recipe_amounts(recipe_ids).items()
+        })
+
+
+def change_recipe(recipe, deltas):
+    """Учитывает изменение состава рецепта у всех, у кого он в корзине."""
+    if deltas:
+        apply(Cart.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True), deltas)
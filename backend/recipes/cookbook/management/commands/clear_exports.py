@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cookbook.models import ShoppingListExport
+
+
+class Command(BaseCommand):
+    help = ('Удаляет выгрузки списка покупок, построенные раньше чем '
+            '--days дней назад, вместе с файлами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        exports = ShoppingListExport.objects.filter(
+            updated__lt=timezone.now() - timedelta(days=options['days']))
+        for name in exports.exclude(file='').values_list('file', flat=True):
+            default_storage.delete(name)
+        deleted, _ = exports.delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено выгрузок: {deleted}'))
@@ -0,0 +1,133 @@
+import random
+from itertools import accumulate
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from cookbook.models import (
+    Cart, Favourite, Follow, Ingredient, Recipe, RecipeIngredient, Tag, User)
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Выпечка', '#EB5757', 'bakery'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные для замеров производительности: '
+            'пользователей, рецепты, избранное, корзины и подписки. '
+            'Популярность авторов и рецептов распределена по закону Ципфа.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--skew', type=float, default=1.1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        call_command('load_ingredients', stdout=self.stdout)
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color})
+        users = self.create_users(options['users'])
+        recipes = self.create_recipes(users, options['recipes'])
+        self.create_links(
+            Favourite, users, recipes, options['favorites'], 'recipe_id')
+        self.create_links(
+            Cart, users, recipes, options['carts'], 'recipe_id')
+        self.create_links(
+            Follow, users, users, options['follows'], 'following_id')
+        call_command('rebuild_counters', stdout=self.stdout)
+        call_command('rebuild_cart_totals', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        call_command('update_search_index', stdout=self.stdout)
+        call_command(
+            'update_similar_recipes', '--full', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}'))
+
+    def weights(self, size):
+        """Накопленные веса Ципфа: первые элементы популярнее."""
+        return list(accumulate(
+            1 / (rank ** self.skew) for rank in range(1, size + 1)))
+
+    def save(self, model, objects):
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size],
+                ignore_conflicts=True)
+
+    def create_users(self, count):
+        start = User.objects.count()
+        self.save(User, [
+            User(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name='Имя', last_name=f'Фамилия {number}',
+                password='password')
+            for number in range(start, start + count)
+        ])
+        return list(User.objects.order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, users, count):
+        author_weights = self.weights(len(users))
+        authors = self.random.choices(
+            users, cum_weights=author_weights, k=count)
+        self.save(Recipe, [
+            Recipe(
+                author_id=author_id,
+                name=f'Рецепт {number}',
+                image='cookbook/sample.png',
+                text='Описание рецепта. ' * self.random.randint(5, 50),
+                cooking_time=self.random.randint(5, 180))
+            for number, author_id in enumerate(authors)
+        ])
+        recipes = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True))
+        new_recipes = recipes[-count:]
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        links = []
+        for recipe_id in new_recipes:
+            links.extend(
+                RecipeIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500))
+                for ingredient_id in self.random.sample(
+                    ingredients, self.random.randint(3, 12)))
+        self.save(RecipeIngredient, links)
+        self.save(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in new_recipes
+            for tag_id in self.random.sample(
+                tags, self.random.randint(1, 3))
+        ])
+        return recipes
+
+    def create_links(self, model, users, targets, average, target_field):
+        target_weights = self.weights(len(targets))
+        objects = []
+        for user_id in users:
+            count = min(
+                int(self.random.expovariate(1 / average)), len(targets))
+            chosen = set(self.random.choices(
+                targets, cum_weights=target_weights, k=count))
+            if model is Follow:
+                chosen.discard(user_id)
+            objects.extend(
+                model(user_id=user_id, **{target_field: target_id})
+                for target_id in chosen)
+        self.save(model, objects)
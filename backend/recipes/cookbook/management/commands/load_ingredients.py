@@ -0,0 +1,61 @@
+import csv
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cookbook.models import Ingredient
+from cookbook.versions import bump_version
+
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, '..', '..', 'data', 'ingredients.csv')
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV (название, единица измерения). '
+            'Уже существующие пары пропускаются, поэтому повторный запуск '
+            'ничего не записывает.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        seen = set(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        total = created = 0
+        batch = []
+        with open(options['path'], encoding='utf-8', newline='') as file:
+            for row in csv.reader(file):
+                if len(row) != 2:
+                    continue
+                total += 1
+                key = (row[0].strip(), row[1].strip())
+                if key in seen:
+                    continue
+                seen.add(key)
+                batch.append(
+                    Ingredient(name=key[0], measurement_unit=key[1]))
+                if len(batch) >= batch_size:
+                    created += self.save(batch)
+                    batch = []
+        created += self.save(batch)
+        if created:
+            bump_version(Ingredient)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {total}, добавлено: {created}, '
+            f'{total / elapsed:.0f} строк/с'))
+
+    def save(self, batch):
+        """Записывает batch и возвращает число действительно добавленных
+        строк: пары, которые успел записать другой процесс, пропускаются
+        через ignore_conflicts и не учитываются."""
+        if not batch:
+            return 0
+        before = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        return Ingredient.objects.count() - before
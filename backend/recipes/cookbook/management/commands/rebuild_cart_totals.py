@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from cookbook.models import CartIngredientTotal, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = ('Сверяет таблицу CartIngredientTotal с корзинами и '
+            'исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='id пользователя.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        # Условие на корзину задаётся одним filter(): второй вызов
+        # добавил бы ещё один JOIN с Cart, и суммы умножились бы на
+        # число корзин с тем же рецептом.
+        carts = {'recipe__customer__isnull': False}
+        totals = CartIngredientTotal.objects.select_for_update()
+        if options['user'] is not None:
+            carts = {'recipe__customer__user': options['user']}
+            totals = totals.filter(user=options['user'])
+        items = RecipeIngredient.objects.filter(**carts)
+        expected = {
+            (row['recipe__customer__user'], row['ingredient']): row['total']
+            for row in items.order_by().values(
+                'recipe__customer__user', 'ingredient'
+            ).annotate(total=Sum('amount')).iterator()
+        }
+        to_delete = []
+        to_update = []
+        for total in totals.iterator():
+            amount = expected.pop((total.user_id, total.ingredient_id), None)
+            if amount is None:
+                to_delete.append(total.id)
+            elif total.amount != amount:
+                total.amount = amount
+                to_update.append(total)
+        batch_size = options['batch_size']
+        for start in range(0, len(to_delete), batch_size):
+            CartIngredientTotal.objects.filter(
+                id__in=to_delete[start:start + batch_size]).delete()
+        CartIngredientTotal.objects.bulk_update(
+            to_update, ['amount'], batch_size=batch_size)
+        CartIngredientTotal.objects.bulk_create(
+            [CartIngredientTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+             for (user_id, ingredient_id), amount in expected.items()],
+            batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено: {len(to_delete)}, исправлено: {len(to_update)}, '
+            f'добавлено: {len(expected)}'))
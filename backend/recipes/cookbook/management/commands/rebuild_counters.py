@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from cookbook.models import Cart, Favourite, Recipe
+
+
+def count_subquery(model):
+    counts = model.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики favorites_count и in_carts_count '
+            'рецептов по таблицам избранного и корзины.')
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.update(
+            favorites_count=count_subquery(Favourite),
+            in_carts_count=count_subquery(Cart),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {updated}'))
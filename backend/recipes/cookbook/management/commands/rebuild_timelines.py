@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cookbook import timelines
+from cookbook.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет ленты подписчиков последними рецептами '
+            'авторов, на которых они подписаны.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='id пользователя.')
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.order_by('user_id')
+        if options['user'] is not None:
+            follows = follows.filter(user_id=options['user'])
+        authors_by_user = {}
+        for user_id, author_id in follows.values_list(
+                'user_id', 'following_id').iterator():
+            authors_by_user.setdefault(user_id, []).append(author_id)
+        for user_id, author_ids in authors_by_user.items():
+            with transaction.atomic():
+                TimelineEntry.objects.filter(user_id=user_id).delete()
+                timelines.backfill(user_id, author_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {len(authors_by_user)}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from cookbook.models import Recipe
+from cookbook.search import update_index
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает поисковый индекс рецептов, например после '
+            'массовой загрузки, при которой сигналы не отправляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            update_index(Recipe.objects.filter(
+                id__in=ids[start:start + batch_size]))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {len(ids)}'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cookbook import similarity
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты: по умолчанию только для '
+            'рецептов, изменённых после прошлого расчёта, с --full — '
+            'для всех.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=256)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['full']:
+            count = similarity.rebuild(options['batch_size'])
+        else:
+            count = similarity.refresh(
+                similarity.changed_recipes(), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Пересчитано рецептов: {0} за {1:.1f} с'.format(
+                count, time.perf_counter() - started)))
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.13 on 2026-10-18 07:55
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сливает повторы (название, единица измерения) перед добавлением
+    ограничения: импорт из админки без id создавал их при каждой
+    загрузке CSV. Строки рецептов переносятся на ингредиент с меньшим
+    id, а если в рецепте оказалось два одинаковых ингредиента, их
+    количество складывается. CartIngredientTotal появится позже
+    (0015) и будет посчитан уже по объединённым строкам."""
+    Ingredient = apps.get_model('cookbook', 'Ingredient')
+    RecipeIngredient = apps.get_model('cookbook', 'RecipeIngredient')
+    duplicates = Ingredient.objects.order_by().values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for row in duplicates.iterator():
+        extra = list(Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit']
+        ).exclude(id=row['keep']).values_list('id', flat=True))
+        RecipeIngredient.objects.filter(
+            ingredient_id__in=extra).update(ingredient_id=row['keep'])
+        Ingredient.objects.filter(id__in=extra).delete()
+    repeated = RecipeIngredient.objects.order_by().values(
+        'recipe', 'ingredient'
+    ).annotate(
+        keep=Min('id'), total=Count('id'), amount=Sum('amount')
+    ).filter(total__gt=1)
+    for row in repeated.iterator():
+        RecipeIngredient.objects.filter(id=row['keep']).update(
+            amount=min(row['amount'], 32767))
+        RecipeIngredient.objects.filter(
+            recipe_id=row['recipe'], ingredient_id=row['ingredient']
+        ).exclude(id=row['keep']).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей должны сработать до
+        # ALTER TABLE в этой же транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0008_auto_20220523_1429'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='amount',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.13 on 2026-10-18 08:03
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+# GIN-индекс и таблица FTS5 зависят от СУБД, поэтому создаются здесь,
+# а не в Meta.indexes модели.
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipe_search_vector_idx ON cookbook_recipe '
+            'USING gin (search_vector)')
+        apps.get_model('cookbook', 'Recipe').objects.update(
+            search_vector=(
+                SearchVector('name', weight='A', config='russian')
+                + SearchVector('text', weight='B', config='russian')))
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE cookbook_recipe_fts '
+            "USING fts5(name, text, tokenize='unicode61')")
+        schema_editor.execute(
+            'INSERT INTO cookbook_recipe_fts (rowid, name, text) '
+            'SELECT id, name, text FROM cookbook_recipe')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX recipe_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE cookbook_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0012_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.13 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0013_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_hash', models.CharField(max_length=64)),
+                ('file_format', models.CharField(max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('file', models.FileField(blank=True, upload_to='exports/')),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistexport',
+            constraint=models.UniqueConstraint(fields=('cart_hash', 'file_format'), name='unique_export'),
+        ),
+    ]
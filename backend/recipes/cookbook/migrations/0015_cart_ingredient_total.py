@@ -0,0 +1,45 @@
+# Generated by Django 3.2.13 on 2026-10-18 08:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_totals(apps, schema_editor):
+    RecipeIngredient = apps.get_model('cookbook', 'RecipeIngredient')
+    CartIngredientTotal = apps.get_model('cookbook', 'CartIngredientTotal')
+    rows = RecipeIngredient.objects.filter(
+        recipe__customer__isnull=False
+    ).order_by().values('recipe__customer__user', 'ingredient').annotate(
+        total=Sum('amount')).iterator()
+    CartIngredientTotal.objects.bulk_create(
+        (CartIngredientTotal(
+            user_id=row['recipe__customer__user'],
+            ingredient_id=row['ingredient'], amount=row['total'])
+         for row in rows),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0014_shopping_list_export'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredientTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cookbook.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cartingredienttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_total'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import EmptyResultSet
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.core.validators import MinValueValidator
 
 
@@ -18,6 +23,13 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=200)
     measurement_unit = models.CharField(max_length=50)
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'),
+        )
+
     def __str__(self):
         return f'{self.name}'
 
@@ -31,12 +43,33 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def newest_per_author(self, limit):
+        """Не больше limit новых рецептов каждого автора из выборки.
+
+        Место рецепта у автора считает ROW_NUMBER() за один проход по
+        индексу (author, -pub_date), без подзапроса на каждую строку.
+        """
+        ranked = self.order_by().annotate(position=Window(
+            RowNumber(), partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )).values('pk', 'position')
+        try:
+            sql, params = ranked.query.sql_with_params()
+        except EmptyResultSet:
+            return self.none()
+        return self.model._default_manager.filter(pk__in=RawSQL(
+            f'SELECT "id" FROM ({sql}) ranked WHERE "position" <= %s',
+            (*params, limit)))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='recipes')
     name = models.CharField(max_length=200)
     image = models.FileField(upload_to='cookbook/')
-    tags = models.ManyToManyField(Tag, related_name='recipe')
+    tags = models.ManyToManyField(
+        Tag, through='RecipeTag', related_name='recipe')
     ingredients = models.ManyToManyField(
         Ingredient, through='RecipeIngredient')
     text = models.TextField()
@@ -47,9 +80,23 @@ class Recipe(models.Model):
     in_cart_of = models.ManyToManyField(
         User, through='Cart', related_name='shopping')
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    favorites_count = models.PositiveIntegerField(default=0)
+    in_carts_count = models.PositiveIntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=('-favorites_count', '-id'),
+                         name='recipe_popular_idx'),
+        )
 
     def __str__(self):
         return f'{self.name}'
@@ -137,3 +184,147 @@ class RecipeIngredient(models.Model):
 
     def __str__(self):
         return f'{self.ingredient} in {self.recipe}'
+
+
+class CartIngredientTotal(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Обновляется приращениями из cookbook.cart_totals при изменении
+    корзины и состава рецептов; rebuild_cart_totals исправляет
+    расхождения.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='cart_totals',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    amount = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_total'),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} in cart of {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт автора в ленте подписчика.
+
+    Заполняется при публикации рецепта (cookbook.timelines.fan_out); рецепты
+    авторов с большим числом подписчиков в ленту не раскладываются
+    и подмешиваются при чтении.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date'),
+                         name='timeline_user_pub_date_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} in feed of {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Ближайший по ингредиентам и тегам рецепт.
+
+    Заполняется командой update_similar_recipes: для каждого рецепта
+    хранится SIMILAR_RECIPES_K соседей с косинусной близостью score.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='similar',
+        on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        related_name='similar_to',
+        on_delete=models.CASCADE
+    )
+    score = models.FloatField()
+    computed = models.DateTimeField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'),
+        )
+        indexes = (
+            models.Index(fields=('recipe', '-score'),
+                         name='similar_recipe_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.similar} is similar to {self.recipe}'
+
+
+class RecipeTag(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'cookbook_recipe_tags'
+        unique_together = ('recipe', 'tag')
+        indexes = (
+            models.Index(fields=('tag', 'recipe'),
+                         name='recipe_tag_tag_recipe_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.tag} in {self.recipe}'
+
+
+class ShoppingListExport(models.Model):
+    """Файл со списком покупок, построенный в фоне.
+
+    Файл определяется хэшем содержимого списка, поэтому одинаковые
+    корзины разных пользователей используют один и тот же файл.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (DONE, 'Готов'),
+        (FAILED, 'Ошибка'),
+    )
+
+    cart_hash = models.CharField(max_length=64)
+    file_format = models.CharField(max_length=10)
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING)
+    file = models.FileField(upload_to='exports/', blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=['cart_hash', 'file_format'],
+                name='unique_export'),
+        )
+
+    def __str__(self):
+        return f'{self.cart_hash}.{self.file_format}'
@@ -0,0 +1,72 @@
+"""Полнотекстовый поиск рецептов.
+
+В PostgreSQL используется столбец Recipe.search_vector с GIN-индексом,
+в SQLite — виртуальная таблица FTS5, в остальных СУБД — icontains.
+"""
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector)
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'cookbook_recipe_fts'
+
+
+def search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def update_index(queryset):
+    """Обновляет поисковый индекс для рецептов из queryset."""
+    if connection.vendor == 'postgresql':
+        queryset.update(search_vector=search_vector())
+    elif connection.vendor == 'sqlite':
+        rows = list(queryset.values_list('id', 'name', 'text'))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                'VALUES (%s, %s, %s)', rows)
+
+
+def remove_from_index(recipe_id):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id])
+
+
+def fts_query(text):
+    """Запрос FTS5: каждое слово в кавычках и с поиском по префиксу."""
+    return ' '.join(
+        '"{0}"*'.format(word.replace('"', '""')) for word in text.split())
+
+
+def search(queryset, text):
+    """Рецепты, подходящие под запрос, упорядоченные по релевантности."""
+    if not text.split():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
+    if connection.vendor == 'sqlite':
+        query = fts_query(text)
+        matches = RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (query,))
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = cookbook_recipe.id',
+            (query,), output_field=FloatField())
+        return queryset.filter(id__in=matches).annotate(
+            rank=rank).order_by('rank', '-pub_date')
+    return queryset.filter(Q(name__icontains=text) | Q(text__icontains=text))
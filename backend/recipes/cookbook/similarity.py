@@ -0,0 +1,177 @@
+"""Похожие рецепты по ингредиентам и тегам.
+
+Рецепт — разреженный вектор TF-IDF по ингредиентам и тегам (вес тегов
+SIMILAR_TAG_WEIGHT), близость — косинус. Произведение матриц считается
+пачками строк, для каждого рецепта в SimilarRecipe сохраняются
+SIMILAR_RECIPES_K ближайших соседей.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredient, RecipeTag, SimilarRecipe
+
+
+def pairs(queryset, field):
+    return np.array(
+        list(queryset.values_list('recipe_id', field)), dtype=np.int64
+    ).reshape(-1, 2)
+
+
+def build_matrix():
+    """Идентификаторы рецептов и матрица с нормированными строками."""
+    ids = np.array(
+        Recipe.objects.order_by('id').values_list('id', flat=True),
+        dtype=np.int64)
+    ingredients = pairs(RecipeIngredient.objects.all(), 'ingredient_id')
+    tags = pairs(RecipeTag.objects.all(), 'tag_id')
+    ingredient_ids, ingredient_columns = np.unique(
+        ingredients[:, 1], return_inverse=True)
+    tag_ids, tag_columns = np.unique(tags[:, 1], return_inverse=True)
+    rows = np.concatenate((
+        np.searchsorted(ids, ingredients[:, 0]),
+        np.searchsorted(ids, tags[:, 0])))
+    columns = np.concatenate((
+        ingredient_columns, tag_columns + len(ingredient_ids)))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, columns)),
+        shape=(len(ids), len(ingredient_ids) + len(tag_ids)))
+    # Повторяющиеся строки RecipeIngredient складываются: нужен 0/1.
+    matrix.data[:] = 1
+    frequency = matrix.getnnz(axis=0)
+    weights = np.log((1 + len(ids)) / (1 + frequency)) + 1
+    weights[len(ingredient_ids):] *= settings.SIMILAR_TAG_WEIGHT
+    matrix = matrix @ sparse.diags(weights)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+    norms[norms == 0] = 1
+    return ids, sparse.csr_matrix(sparse.diags(1 / norms.ravel()) @ matrix)
+
+
+def similarities(matrix, rows):
+    """Для каждого рецепта из rows — номера рецептов с ненулевой
+    близостью к нему (кроме него самого) и сама близость."""
+    scores = (matrix[rows] @ matrix.T).tocsr()
+    for index, row in enumerate(rows):
+        start, end = scores.indptr[index], scores.indptr[index + 1]
+        columns = scores.indices[start:end]
+        other = columns != row
+        yield row, columns[other], scores.data[start:end][other]
+
+
+def top_k(neighbours, k):
+    """Оставляет k ближайших, от более близких к менее близким."""
+    for row, columns, values in neighbours:
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            columns, values = columns[best], values[best]
+        order = np.argsort(-values, kind='stable')
+        yield row, columns[order], values[order]
+
+
+def save_neighbours(ids, neighbours, computed):
+    rows = []
+    objects = []
+    for row, columns, values in neighbours:
+        rows.append(row)
+        objects += [
+            SimilarRecipe(recipe_id=ids[row].item(), similar_id=similar_id,
+                          score=score, computed=computed)
+            for similar_id, score in zip(
+                ids[columns].tolist(), values.tolist())]
+    SimilarRecipe.objects.filter(recipe_id__in=ids[rows].tolist()).delete()
+    SimilarRecipe.objects.bulk_create(objects, batch_size=1000)
+
+
+def rebuild(batch_size=256):
+    """Пересчитывает соседей всех рецептов. Возвращает их число."""
+    k = settings.SIMILAR_RECIPES_K
+    computed = timezone.now()
+    ids, matrix = build_matrix()
+    for start in range(0, len(ids), batch_size):
+        rows = np.arange(start, min(start + batch_size, len(ids)))
+        neighbours = top_k(similarities(matrix, rows), k)
+        with transaction.atomic():
+            save_neighbours(ids, neighbours, computed)
+    SimilarRecipe.objects.filter(computed__lt=computed).delete()
+    return len(ids)
+
+
+def changed_recipes():
+    """Рецепты, изменённые после последнего расчёта, и рецепты
+    без сохранённых соседей."""
+    last = SimilarRecipe.objects.aggregate(last=Max('computed'))['last']
+    missing = ~Exists(SimilarRecipe.objects.filter(recipe=OuterRef('pk')))
+    condition = missing if last is None else missing | Q(updated__gt=last)
+    return set(Recipe.objects.filter(condition).values_list('id', flat=True))
+
+
+def refresh(recipe_ids, batch_size=256):
+    """Пересчитывает соседей изменённых рецептов и добавляет их
+    в списки тех рецептов, в чьи k ближайших они теперь входят.
+
+    Рецепт, переставший быть похожим, освобождает место в чужих
+    списках, но оно заполняется только при полном пересчёте. Всё
+    обновление идёт одной транзакцией.
+    """
+    k = settings.SIMILAR_RECIPES_K
+    computed = timezone.now()
+    ids, matrix = build_matrix()
+    rows = np.flatnonzero(np.isin(ids, list(recipe_ids)))
+    changed = ids[rows].tolist()
+    with transaction.atomic():
+        # Читатели не должны видеть списки, из которых удалены
+        # изменённые рецепты, пока они не добавлены заново.
+        SimilarRecipe.objects.filter(similar_id__in=changed).delete()
+        counts = np.zeros(len(ids), dtype=np.int64)
+        lowest = np.zeros(len(ids))
+        for recipe_id, count, low in SimilarRecipe.objects.order_by().values(
+                'recipe_id').annotate(
+                count=Count('id'), low=Min('score')).values_list(
+                'recipe_id', 'count', 'low').iterator():
+            row = np.searchsorted(ids, recipe_id)
+            counts[row], lowest[row] = count, low
+        is_changed = np.zeros(len(ids), dtype=bool)
+        is_changed[rows] = True
+        touched = set()
+        for offset in range(0, len(rows), batch_size):
+            own = []
+            reverse = []
+            for row, columns, values in similarities(
+                    matrix, rows[offset:offset + batch_size]):
+                own.append((row, columns, values))
+                accepted = ~is_changed[columns] & (
+                    (counts[columns] < k) | (values > lowest[columns]))
+                reverse += [
+                    SimilarRecipe(
+                        recipe_id=recipe_id, similar_id=ids[row].item(),
+                        score=score, computed=computed)
+                    for recipe_id, score in zip(
+                        ids[columns[accepted]].tolist(),
+                        values[accepted].tolist())]
+                touched.update(ids[columns[accepted]].tolist())
+            save_neighbours(ids, top_k(own, k), computed)
+            SimilarRecipe.objects.bulk_create(
+                reverse, batch_size=1000, ignore_conflicts=True)
+        trim(touched, k)
+    return len(changed)
+
+
+def trim(recipe_ids, k):
+    """Оставляет у рецептов не больше k соседей."""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), 1000):
+        extra = []
+        current = None
+        kept = 0
+        for recipe_id, pk in SimilarRecipe.objects.filter(
+                recipe_id__in=recipe_ids[start:start + 1000]
+        ).order_by('recipe_id', '-score').values_list('recipe_id', 'id'):
+            if recipe_id != current:
+                current, kept = recipe_id, 0
+            kept += 1
+            if kept > k:
+                extra.append(pk)
+        SimilarRecipe.objects.filter(id__in=extra).delete()
@@ -0,0 +1,41 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from .models import (Cart, CartIngredientTotal, Ingredient, Recipe,
+                     RecipeIngredient, User)
+
+
+class RebuildCartTotalsTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(
+                username=f'user{number}', email=f'user{number}@example.com')
+            for number in range(2)]
+        recipe = Recipe.objects.create(
+            author=self.users[0], name='Омлет', text='Текст',
+            image='cookbook/recipe.png', cooking_time=10)
+        self.ingredient = Ingredient.objects.create(
+            name='яйца', measurement_unit='шт')
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingredient, amount=5)
+        for user in self.users:
+            Cart.objects.create(user=user, recipe=recipe)
+            CartIngredientTotal.objects.create(
+                user=user, ingredient=self.ingredient, amount=1)
+
+    def rebuild(self, *args):
+        call_command('rebuild_cart_totals', *args, stdout=StringIO())
+        return dict(CartIngredientTotal.objects.values_list(
+            'user_id', 'amount'))
+
+    def test_rebuild_all(self):
+        self.assertEqual(
+            self.rebuild(), {user.id: 5 for user in self.users})
+
+    def test_rebuild_one_user(self):
+        first, second = self.users
+        self.assertEqual(
+            self.rebuild('--user', str(first.id)),
+            {first.id: 5, second.id: 1})
@@ -0,0 +1,132 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается в TimelineEntry всех подписчиков автора
+(fan-out on write). Для авторов, у которых подписчиков больше
+FEED_FANOUT_LIMIT, раскладка слишком дорога: их рецепты подмешиваются
+при чтении ленты. В ленте хранится не больше FEED_MAX_ENTRIES записей
+на пользователя: лишние удаляет trim при каждой записи в ленты, чтение
+ленты ничего не пишет.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, OuterRef, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Recipe, TimelineEntry
+
+PULL_AUTHORS_KEY = 'feed:pull_authors'
+
+
+def is_pull_author(author_id):
+    limit = settings.FEED_FANOUT_LIMIT
+    return Follow.objects.filter(following_id=author_id)[limit:].exists()
+
+
+def pull_authors():
+    """Авторы, рецепты которых не раскладываются по лентам."""
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = set(Follow.objects.order_by().values(
+            'following_id'
+        ).annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('following_id', flat=True))
+        cache.set(
+            PULL_AUTHORS_KEY, authors, settings.FEED_PULL_AUTHORS_TIMEOUT)
+    return authors
+
+
+def update_pull_author(author_id):
+    """Сверяет автора с кэшем pull_authors и возвращает, подмешивается
+    ли он при чтении.
+
+    Автор, перешедший порог, сразу начинает подмешиваться, а не после
+    истечения кэша. Автору, вернувшемуся под порог, ленты подписчиков
+    заполняются его последними рецептами.
+    """
+    pulled = is_pull_author(author_id)
+    if pulled != (author_id in pull_authors()):
+        cache.delete(PULL_AUTHORS_KEY)
+        if not pulled:
+            fill(Follow.objects.filter(
+                following_id=author_id).values_list('user_id', flat=True),
+                [author_id])
+    return pulled
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    if update_pull_author(recipe.author_id):
+        return
+    followers = list(Follow.objects.filter(
+        following_id=recipe.author_id).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, recipe=recipe,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+         for user_id in followers],
+        batch_size=1000, ignore_conflicts=True)
+    trim(followers)
+
+
+def fill(user_ids, author_ids):
+    """Добавляет в ленты пользователей последние рецепты авторов."""
+    user_ids = list(user_ids)
+    author_ids = set(author_ids) - pull_authors()
+    if not user_ids or not author_ids:
+        return
+    recipes = list(Recipe.objects.filter(
+        author_id__in=author_ids
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'author_id', 'pub_date')[:settings.FEED_MAX_ENTRIES])
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id, pub_date=pub_date)
+         for user_id in user_ids
+         for recipe_id, author_id, pub_date in recipes],
+        batch_size=1000, ignore_conflicts=True)
+    trim(user_ids)
+
+
+def backfill(user_id, author_ids):
+    """Добавляет в ленту последние рецепты авторов после подписки."""
+    fill([user_id], author_ids)
+
+
+def remove(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def trim(user_ids):
+    """Оставляет в лентах пользователей FEED_MAX_ENTRIES последних
+    записей. Номер записи в ленте считает ROW_NUMBER() за один проход
+    по индексу (user, -pub_date)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    ranked = TimelineEntry.objects.filter(
+        user_id__in=user_ids
+    ).order_by().annotate(position=Window(
+        RowNumber(), partition_by=F('user_id'),
+        order_by=(F('pub_date').desc(), F('id').desc()),
+    )).values('pk', 'position')
+    sql, params = ranked.query.sql_with_params()
+    TimelineEntry.objects.filter(pk__in=RawSQL(
+        f'SELECT "id" FROM ({sql}) ranked WHERE "position" > %s',
+        (*params, settings.FEED_MAX_ENTRIES))).delete()
+
+
+def filter_feed(queryset, user):
+    """Рецепты из ленты пользователя и рецепты авторов, которые
+    подмешиваются при чтении."""
+    pulled = set(Follow.objects.filter(
+        user=user, following_id__in=pull_authors()
+    ).values_list('following_id', flat=True))
+    if not pulled:
+        return queryset.filter(timelineentry__user=user)
+    return queryset.filter(
+        Q(Exists(TimelineEntry.objects.filter(
+            user=user, recipe=OuterRef('pk'))))
+        | Q(author_id__in=pulled))
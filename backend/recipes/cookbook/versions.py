@@ -0,0 +1,62 @@
+"""Счётчики версий данных в кэше по умолчанию.
+
+Версии хранятся без срока. Чтобы все процессы видели одну версию,
+кэш должен быть общим (например, Memcached): LocMemCache у каждого
+процесса свой, и повышение версии в одном воркере другие не увидят.
+"""
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def version_key(model, pk=None):
+    key = f'version:{model._meta.label_lower}'
+    if pk is not None:
+        key = f'{key}:{pk}'
+    return key
+
+
+def get_version(model, pk=None):
+    """Текущая версия данных модели или одного её объекта.
+
+    Начальное значение берётся из времени, чтобы после сброса или
+    вытеснения из кэша не повторить уже выданную версию.
+    """
+    key = version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(model, pk=None):
+    """Увеличивает версию и возвращает новое значение."""
+    try:
+        return cache.incr(version_key(model, pk))
+    except ValueError:
+        return get_version(model, pk)
+
+
+def is_cache_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@checks.register()
+def check_shared_cache(app_configs, **kwargs):
+    if is_cache_shared():
+        return []
+    return [checks.Warning(
+        'Кэш по умолчанию не общий для процессов: при нескольких '
+        'воркерах версии данных расходятся, ETag и кэши ответов могут '
+        'устаревать, поиск по продуктам не видит чужих изменений.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION общего кэша, '
+             'например Memcached.',
+        id='cookbook.W001')]
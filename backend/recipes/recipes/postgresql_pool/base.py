@@ -0,0 +1,119 @@
+"""PostgreSQL с пулом соединений psycopg2 в каждом процессе.
+
+Размер пула задаётся в OPTIONS['pool'] ({'min_size': ..., 'max_size':
+..., 'timeout': ...}). close() возвращает соединение в пул вместо
+закрытия, поэтому CONN_MAX_AGE должен быть 0. psycopg2 держит открытыми
+не больше min_size свободных соединений, остальные закрывает при
+возврате. Когда все max_size соединений заняты, запрос ждёт свободное
+до timeout секунд.
+"""
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extras
+from psycopg2 import pool as psycopg2_pool
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+
+def is_alive(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class BlockingConnectionPool(psycopg2_pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool, который при исчерпании ждёт возврата
+    соединения вместо PoolError и помнит, когда соединение вернули."""
+
+    def __init__(self, minconn, maxconn, *args, timeout=30, **kwargs):
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        self.returned_at = {}
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise psycopg2_pool.PoolError(
+                'connection pool exhausted: no connection was returned '
+                'within {0} s'.format(self.timeout))
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def idle_time(self, connection):
+        """Сколько секунд соединение пролежало в пуле; 0 для нового."""
+        returned_at = self.returned_at.pop(id(connection), None)
+        return 0 if returned_at is None else time.monotonic() - returned_at
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        if not conn.closed:
+            self.returned_at[id(conn)] = time.monotonic()
+        self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_pool(self, conn_params):
+        # Пул создаётся заново после fork, чтобы воркеры не делили сокеты.
+        key = (self.alias, os.getpid())
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                options = self.settings_dict['OPTIONS'].get('pool', {})
+                max_size = options.get('max_size', 10)
+                pool = self._pools[key] = BlockingConnectionPool(
+                    options.get('min_size', max_size), max_size,
+                    timeout=options.get('timeout', 30), **conn_params)
+        return pool
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.getconn()
+        if (self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and self.pool.idle_time(connection)
+                > settings.DB_HEALTH_CHECK_IDLE
+                and not is_alive(connection)):
+            self.pool.putconn(connection, close=True)
+            connection = self.pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                return self.pool.putconn(
+                    self.connection, close=bool(self.connection.closed))
+
+    @classmethod
+    def close_pools(cls):
+        with cls._pools_lock:
+            for key, pool in list(cls._pools.items()):
+                if key[1] == os.getpid():
+                    pool.closeall()
+                    del cls._pools[key]
@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.metrics_middleware',
+    'api.replicas.replica_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +58,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'recipes.wsgi.application'
+ASGI_APPLICATION = 'recipes.asgi.application'
 
 
 DATABASES = {
@@ -65,7 +68,49 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS') == '1',
+    }
+}
+
+# Пул соединений в каждом процессе (только PostgreSQL), 0 — без пула.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+if DB_POOL_SIZE and (DATABASES['default']['ENGINE'] or '').startswith(
+        'django.db.backends.postgresql'):
+    DATABASES['default']['ENGINE'] = 'recipes.postgresql_pool'
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', DB_POOL_SIZE)),
+        'max_size': DB_POOL_SIZE,
+        'timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }}
+
+# Соединение проверяется запросом к базе, только если простаивало дольше.
+DB_HEALTH_CHECK_IDLE = int(os.getenv('DB_HEALTH_CHECK_IDLE', 10))
+
+# Реплики для чтения: через запятую host[:port] для PostgreSQL
+# или пути к файлам для SQLite. Остальные параметры берутся из default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    alias = 'replica{0}'.format(number)
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if 'sqlite' in (DATABASES[alias]['ENGINE'] or ''):
+        DATABASES[alias]['NAME'] = replica.strip()
+    else:
+        host, _, port = replica.strip().partition(':')
+        DATABASES[alias]['HOST'] = host
+        DATABASES[alias]['PORT'] = port or DATABASES[alias]['PORT']
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -103,6 +148,23 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', 5 * 1024 * 1024))
+
+FEED_MAX_ENTRIES = int(os.getenv('FEED_MAX_ENTRIES', 500))
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_PULL_AUTHORS_TIMEOUT = int(os.getenv('FEED_PULL_AUTHORS_TIMEOUT', 300))
+
+SIMILAR_RECIPES_K = int(os.getenv('SIMILAR_RECIPES_K', 20))
+SIMILAR_TAG_WEIGHT = float(os.getenv('SIMILAR_TAG_WEIGHT', 0.5))
+
+PANTRY_INDEX_MAX_CHANGES = int(os.getenv('PANTRY_INDEX_MAX_CHANGES', 1000))
+PANTRY_INDEX_LOG_TIMEOUT = int(os.getenv('PANTRY_INDEX_LOG_TIMEOUT', 3600))
+
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 2))
+EXPORT_TIMEOUT = int(os.getenv('EXPORT_TIMEOUT', 300))
+EXPORT_PDF_FONT = os.getenv(
+    'EXPORT_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 AUTH_USER_MODEL = 'cookbook.User'
 
 REST_FRAMEWORK = {
@@ -113,7 +175,10 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'SEARCH_PARAM': 'name'
 }
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))